@@ -1,7 +1,44 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
 import torch
 import torch.nn as nn
 import numpy as np
+import pandas as pd
 from sklearn.preprocessing import StandardScaler
+from torch.utils.data import DataLoader, TensorDataset
+
+from feature_matrix import FeatureMatrix, parse_column
+from preprocessing import ERROR_SUFFIX
+from spot import DEFAULT_LEVEL, DEFAULT_Q, calibration_size, make_spot, run_calibrated, spot_from_state
+
+# Bump when the artifact layout or the training procedure changes, so stale
+# artifacts are retrained instead of loaded.
+ARTIFACT_VERSION = 3
+MODEL_DIR = os.environ.get("MODEL_DIR", "models")
+
+DEFAULT_PARAMS = {
+    "epochs": 500,
+    "lr": 0.01,
+    # Train only on first 20% (strictly normal period in our expanded data)
+    "train_fraction": 0.2,
+    "seed": 42,
+    # None trains full-batch, as the original fixed 500-epoch loop did
+    "batch_size": None,
+    # Early stopping on the last `val_fraction` of the training slice; None disables it
+    "patience": None,
+    "val_fraction": 0.2,
+    # Streaming POT threshold (see spot.py): risk q, initial tail quantile,
+    # and the DSPOT drift window in windows (None = plain SPOT)
+    "risk": DEFAULT_Q,
+    "tail_level": DEFAULT_LEVEL,
+    "drift_depth": None,
+}
+
+INFERENCE_BACKENDS = ("eager", "torchscript", "compile")
 
 
 class AutoEncoder(nn.Module):
@@ -23,70 +60,371 @@ class AutoEncoder(nn.Module):
         return self.decoder(self.encoder(x))
 
 
-def detect_behavior_anomalies(df):
-    features = df.drop(columns=["window"])
+def configure_threads(num_threads=None, interop_threads=None):
+    """
+    Pin torch intra-op / inter-op thread pools (CPU-only nodes). The inter-op
+    pool can only be sized before torch starts parallel work.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            print(f"[Training] Could not set inter-op threads: {e}")
 
-    scaler = StandardScaler()
-    scaled = scaler.fit_transform(features.values)
 
-    X = torch.tensor(scaled, dtype=torch.float32)
+def fit_autoencoder(X_train, params):
+    """
+    Train an AutoEncoder on `X_train`. Runs full-batch unless `batch_size` is
+    set, and stops early on a held-out tail slice when `patience` is set.
+    Returns the model and a training history (epochs run, time, losses).
+    """
+    torch.manual_seed(params["seed"])
+    autoencoder = AutoEncoder(X_train.shape[1])
+    optimizer = torch.optim.Adam(autoencoder.parameters(), lr=params["lr"])
+    loss_fn = nn.MSELoss()
+
+    X_val = None
+    if params["patience"]:
+        # Time-ordered data: validate on the most recent part of the normal period
+        n_val = max(1, int(params["val_fraction"] * len(X_train)))
+        X_train, X_val = X_train[:-n_val], X_train[-n_val:]
+
+    if params["batch_size"]:
+        generator = torch.Generator().manual_seed(params["seed"])
+        loader = DataLoader(
+            TensorDataset(X_train), batch_size=params["batch_size"],
+            shuffle=True, generator=generator,
+        )
+    else:
+        loader = [(X_train,)]
+
+    best_val, best_state, stale = float("inf"), None, 0
+    epochs_run = 0
+    train_loss = float("nan")
+    started = time.perf_counter()
+
+    for epoch in range(params["epochs"]):
+        autoencoder.train()
+        total, seen = 0.0, 0
+        for (batch,) in loader:
+            optimizer.zero_grad()
+            recon = autoencoder(batch)
+            loss = loss_fn(recon, batch)
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(batch)
+            seen += len(batch)
+        train_loss = total / max(seen, 1)
+        epochs_run = epoch + 1
+
+        if X_val is not None:
+            autoencoder.eval()
+            with torch.no_grad():
+                val_loss = loss_fn(autoencoder(X_val), X_val).item()
+            if val_loss < best_val:
+                best_val, stale = val_loss, 0
+                best_state = {k: v.clone() for k, v in autoencoder.state_dict().items()}
+            else:
+                stale += 1
+                if stale >= params["patience"]:
+                    break
+
+    if best_state is not None:
+        autoencoder.load_state_dict(best_state)
+
+    elapsed = time.perf_counter() - started
+    history = {
+        "epochs_run": epochs_run,
+        "seconds": elapsed,
+        "seconds_per_epoch": elapsed / max(epochs_run, 1),
+        "final_loss": train_loss,
+        "best_val_loss": best_val if X_val is not None else float("nan"),
+    }
+    print(
+        f"[Training] {epochs_run} epochs in {elapsed:.2f}s "
+        f"({history['seconds_per_epoch'] * 1000:.2f} ms/epoch), final loss {train_loss:.6f}"
+        + (f", best val loss {best_val:.6f}" if X_val is not None else "")
+    )
+    return autoencoder, history
+
+
+def _features(df):
+    """The {signal}_{stat} columns of a window frame as a FeatureMatrix (scores and flags are ignored)."""
+    return df if isinstance(df, FeatureMatrix) else FeatureMatrix.from_frame(df)
+
+
+def training_key(df, params):
+    """Hash of the training features and hyperparameters an artifact is keyed by."""
+    features = _features(df)
+    h = hashlib.sha256()
+    h.update(json.dumps({"version": ARTIFACT_VERSION, "params": params}, sort_keys=True).encode())
+    h.update(json.dumps(features.columns).encode())
+    # A row-major block is hashed in place
+    h.update(np.ascontiguousarray(features.values))
+    return h.hexdigest()
+
+
+def calibrate_threshold(errors, params):
+    """
+    Fit the streaming POT threshold on the training-split errors (widened to
+    the few scores SPOT/DSPOT need on short runs). Later windows only need
+    an O(1) update each (see spot.SPOT). Returns (spot, calibration size).
+    """
+    depth = params["drift_depth"]
+    if depth and len(errors) < depth + 2:
+        print(f"Only {len(errors)} windows: too few for DSPOT(depth={depth}), using SPOT")
+        depth = None
+    n = calibration_size(len(errors), params["train_fraction"], depth)
+    spot = make_spot(params["risk"], params["tail_level"], depth).fit(errors[:n])
+    print(f"Calibration windows: {n}")
+    print(f"Max train error: {errors[:n].max():.6f}")
+    print(f"SPOT initial threshold t: {spot.t:.6f} ({spot.n_peaks} peaks)")
+    print(f"Final Dynamic Threshold: {spot.threshold:.6f}")
+    return spot, n
+
+
+class BehaviorModel:
+    """Fitted scaler, AutoEncoder weights, feature order and calibrated SPOT state as one artifact."""
+
+    def __init__(self, columns, mean, scale, autoencoder, spot_state, params, key=None, history=None):
+        self.columns = list(columns)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self._mean32 = self.mean.astype(np.float32)
+        self._scale32 = self.scale.astype(np.float32)
+        self.autoencoder = autoencoder.eval()
+        self.spot_state = spot_state
+        self.params = dict(params)
+        self.key = key
+        self.history = dict(history or {})
+        self._infer = self.autoencoder
+
+        # Features are {signal}_{stat}; a one-hot (features x signals) map folds
+        # per-feature errors into per-signal errors with one matmul
+        names = [parse_column(c)[0] for c in self.columns]
+        self.signals = list(dict.fromkeys(names))
+        codes = [self.signals.index(name) for name in names]
+        self.signal_map = np.zeros((len(self.columns), len(self.signals)), dtype=np.float32)
+        self.signal_map[np.arange(len(self.columns)), codes] = 1.0
+
+    def threshold_model(self):
+        """A fresh SPOT/DSPOT at its calibrated state; feed it scores with .update / .run."""
+        return spot_from_state(self.spot_state)
+
+    @property
+    def threshold(self):
+        """Threshold right after calibration (the streaming one moves as scores arrive)."""
+        return self.threshold_model().threshold
+
+    def optimize(self, backend="eager"):
+        """Swap the inference module for a TorchScript trace or a torch.compile graph."""
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend {backend!r}; expected one of {INFERENCE_BACKENDS}")
+        if backend == "torchscript":
+            example = torch.zeros(1, len(self.columns))
+            with torch.no_grad():
+                self._infer = torch.jit.trace(self.autoencoder, example)
+        elif backend == "compile":
+            self._infer = torch.compile(self.autoencoder)
+        else:
+            self._infer = self.autoencoder
+        return self
+
+    def transform(self, values, copy=True):
+        """
+        Raw feature matrix (columns in `self.columns` order) -> scaled float32
+        tensor. Scaling happens in float32 and the tensor shares the array's
+        memory (torch.from_numpy); with copy=False a writeable float32
+        `values` block is scaled in place (read-only views are still copied).
+        """
+        X = np.asarray(values, dtype=np.float32)
+        if copy or not X.flags.writeable:
+            X = X.copy()
+        X -= self._mean32
+        X /= self._scale32
+        return torch.from_numpy(X)
+
+    def matrix(self, df):
+        """FeatureMatrix of `df` in `self.columns` order; a view when the columns already are in that order."""
+        if isinstance(df, FeatureMatrix):
+            if df.columns == self.columns:
+                return df
+            return FeatureMatrix(df.values[:, [df.columns.index(c) for c in self.columns]], self.columns, df.index)
+        return FeatureMatrix.from_frame(df, self.columns)
+
+    def score(self, df):
+        """Per-window reconstruction error (inference only)."""
+        return self.score_values(self.matrix(df).values)
+
+    def score_values(self, values, copy=True):
+        # Use per-sample MSE
+        return self.feature_errors(values, copy).mean(axis=1)
+
+    def feature_errors(self, values, copy=True):
+        """Squared reconstruction error per window and feature, float32 (n_windows, n_features)."""
+        X = self.transform(values, copy)
+        with torch.no_grad():
+            recon = self._infer(X)
+            return ((X - recon) ** 2).numpy()
+
+    def signal_errors(self, errors):
+        """Fold a feature_errors matrix into per-signal error sums (n_windows, len(self.signals))."""
+        return errors @ self.signal_map
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        torch.save({
+            "version": ARTIFACT_VERSION,
+            "key": self.key,
+            "params": self.params,
+            "columns": self.columns,
+            "mean": torch.from_numpy(self.mean),
+            "scale": torch.from_numpy(self.scale),
+            "spot": self.spot_state,
+            "state_dict": self.autoencoder.state_dict(),
+            "history": self.history,
+        }, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        artifact = torch.load(path, weights_only=True)
+        if artifact["version"] != ARTIFACT_VERSION:
+            raise ValueError(f"Model artifact {path} has version {artifact['version']}, expected {ARTIFACT_VERSION}")
+
+        autoencoder = AutoEncoder(len(artifact["columns"]))
+        autoencoder.load_state_dict(artifact["state_dict"])
+        return cls(
+            artifact["columns"],
+            artifact["mean"].numpy(),
+            artifact["scale"].numpy(),
+            autoencoder,
+            artifact["spot"],
+            artifact["params"],
+            artifact["key"],
+            artifact["history"],
+        )
+
+
+def train_behavior_model(df, **params):
+    """Fit the scaler and AutoEncoder on `df` and calibrate the streaming threshold."""
+    params = {**DEFAULT_PARAMS, **params}
+    features = _features(df)
+
+    scaler = StandardScaler().fit(features.values)
+    # Scaled in float32 into one new row-major block that the tensor shares
+    scaled = np.array(features.values, order="C")
+    scaled -= scaler.mean_.astype(np.float32)
+    scaled /= scaler.scale_.astype(np.float32)
+    X = torch.from_numpy(scaled)
 
-    # Train only on first 20% (strictly normal period in our expanded data)
     # This prevents the model from "learning" the anomalies as normal behavior.
-    split_idx = int(0.2 * len(X))
+    split_idx = int(params["train_fraction"] * len(X))
     X_train = X[:split_idx]
-    X_test = X
 
-    model = AutoEncoder(X.shape[1])
-    optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
-    loss_fn = nn.MSELoss()
+    print(f"Training split index: {split_idx}")
+    autoencoder, history = fit_autoencoder(X_train, params)
 
-    # Train only on normal portion
-    for epoch in range(500):
-        optimizer.zero_grad()
-        recon = model(X_train)
-        loss = loss_fn(recon, X_train)
-        loss.backward()
-        optimizer.step()
-
-    # Evaluate on full dataset
-    with torch.no_grad():
-        recon_full = model(X_test)
-        # Use per-sample MSE
-        errors = ((X_test - recon_full) ** 2).mean(dim=1).numpy()
-
-    df["behavior_score"] = errors
-
-    # --- Dynamic Thresholding (Inspired by POT) ---
-    # Instead of a fixed Mean + 3*Std (which assumes Gaussian noise),
-    # we look at the tail of the distribution.
-    train_errors = errors[:split_idx]
-    mean_train = np.mean(train_errors)
-    std_train = np.std(train_errors)
-
-    # 1. Base threshold (Gaussian assumption)
-    base_threshold = mean_train + 3 * std_train
-    
-    # 2. Tail-based threshold (Percentile)
-    # We look at where the "peaks" start to emerge.
-    # If the distribution is heavy-tailed, the 98th percentile will be
-    # significantly higher than the base threshold.
-    tail_threshold = np.percentile(errors, 98)
-    
-    # Selection logic: choose the more conservative one if noise is high,
-    # or the more sensitive one if the system is very stable.
-    if std_train < 1e-4:
-        # High confidence in training data, any deviation is a potential anomaly
-        threshold = max(base_threshold, np.percentile(errors, 90))
+    model = BehaviorModel(
+        features.columns, scaler.mean_, scaler.scale_, autoencoder,
+        spot_state=None, params=params, key=training_key(features, params), history=history,
+    )
+    spot, n = calibrate_threshold(model.score(features), params)
+    # Scoring this same data later judges these windows against the calibrated threshold
+    model.spot_state = {**spot.state(), "calibration": n}
+    return model
+
+
+def artifact_path(key, model_dir=MODEL_DIR):
+    return os.path.join(model_dir, f"behavior-v{ARTIFACT_VERSION}-{key[:16]}.pt")
+
+
+def load_or_train(df, model_dir=MODEL_DIR, retrain=False, **params):
+    """
+    Load the artifact trained on exactly this data and these hyperparameters,
+    training and saving it first if it does not exist (or `retrain` is set).
+    """
+    params = {**DEFAULT_PARAMS, **params}
+    features = _features(df)
+    path = artifact_path(training_key(features, params), model_dir)
+    if not retrain and os.path.exists(path):
+        return BehaviorModel.load(path)
+
+    model = train_behavior_model(features, **params)
+    model.save(path)
+    return model
+
+
+def retrain(df, model_dir=MODEL_DIR, **params):
+    """Force a fresh fit, replacing any stored artifact for this data."""
+    return load_or_train(df, model_dir, retrain=True, **params)
+
+
+def detect_behavior_anomalies(df, model=None, model_dir=MODEL_DIR, backend="eager", **params):
+    """
+    Score windows with a persisted behavior model. Without an explicit
+    `model`, the artifact for this data is loaded (or trained once).
+    `backend` selects eager, TorchScript or torch.compile inference.
+    The per-signal share of the reconstruction error from the same forward
+    pass is kept as float32 {signal}_error columns for root-cause attribution.
+    `df` is a window frame or a FeatureMatrix. Returns a new frame with the
+    score, flag and error columns appended; its feature columns share the
+    input's block.
+    """
+    features = _features(df)
+    frame = features.to_frame() if isinstance(df, FeatureMatrix) else df
+    trained_on_df = model is None
+    if model is None:
+        model = load_or_train(features, model_dir, **params)
+    if backend != "eager":
+        model.optimize(backend)
+
+    # The shared block is only read: scaling makes the one float32 copy torch uses
+    # (or reuses a block gathered just now to put the columns in model order)
+    matrix = model.matrix(features)
+    errors = model.feature_errors(matrix.values, copy=matrix is features)
+    scores = errors.mean(axis=1)
+    # The windows the threshold was calibrated on are judged against it; the rest are
+    # streamed in window order from the calibrated state, as the online detector does
+    if not trained_on_df and model.key != training_key(features, model.params):
+        calibrated = 0
     else:
-        # More noise, look for significant peaks over the threshold
-        threshold = max(base_threshold, tail_threshold)
+        calibrated = model.spot_state.get("calibration", 0)
+    flags = run_calibrated(model.threshold_model(), scores, calibrated)
 
-    print(f"Training split index: {split_idx}")
-    print(f"Max train error: {train_errors.max():.6f}")
-    print(f"98th percentile error: {tail_threshold:.6f}")
-    print(f"Final Dynamic Threshold: {threshold:.6f}")
+    error_columns = [f"{signal}{ERROR_SUFFIX}" for signal in model.signals]
+    scored = pd.DataFrame(model.signal_errors(errors), columns=error_columns, index=frame.index)
+    scored.insert(0, "behavior_score", scores)
+    scored.insert(1, "behavior_anomaly", flags)
+    # Joined as whole blocks; adding hundreds of error columns one by one fragments the frame
+    return pd.concat([frame.drop(columns=scored.columns, errors="ignore"), scored], axis=1)
+
+
+if __name__ == "__main__":
+    from preprocessing import build_windows
 
-    df["behavior_anomaly"] = df["behavior_score"] > threshold
+    parser = argparse.ArgumentParser(description="Train the behavior AutoEncoder offline and store the artifact.")
+    parser.add_argument("timeseries", help="Long-format time-series CSV")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--epochs", type=int, default=DEFAULT_PARAMS["epochs"])
+    parser.add_argument("--lr", type=float, default=DEFAULT_PARAMS["lr"])
+    parser.add_argument("--train-fraction", type=float, default=DEFAULT_PARAMS["train_fraction"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_PARAMS["seed"])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_PARAMS["batch_size"])
+    parser.add_argument("--patience", type=int, default=DEFAULT_PARAMS["patience"])
+    parser.add_argument("--val-fraction", type=float, default=DEFAULT_PARAMS["val_fraction"])
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--interop-threads", type=int, default=None, help="torch inter-op threads")
+    args = parser.parse_args()
 
-    return df
\ No newline at end of file
+    configure_threads(args.threads, args.interop_threads)
+    windows = build_windows(args.timeseries)
+    model = retrain(
+        windows, args.model_dir,
+        epochs=args.epochs, lr=args.lr, train_fraction=args.train_fraction, seed=args.seed,
+        batch_size=args.batch_size, patience=args.patience, val_fraction=args.val_fraction,
+    )
+    print(f"Saved {artifact_path(model.key, args.model_dir)}")
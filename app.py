@@ -1,13 +1,128 @@
+import asyncio
 import streamlit as st
 import pandas as pd
 import os
-from preprocessing import build_windows
+import shutil
+import tempfile
+import time
+from preprocessing import WINDOW_MINUTES, build_windows, load_timeseries
+from timeseries_cache import cache_timeseries, content_hash
 from anomaly_model import detect_behavior_anomalies
 from structure_model import detect_structure_anomalies
 from event_builder import build_events
 from clustering import cluster_events
 from llm_parser import parse_operator_logs
+from log_correlation import LOG_PADDING_MINUTES, LogIndex
 from plotting import plot_events_and_logs, plot_raw_timeseries, plot_anomaly_scores
+from llm_service import diagnose_events, format_root_causes, rule_based_assessment, stats as provider_stats
+from profiling import Profiler
+
+# Pipeline results are cached per (upload hashes, parameters) and shared across sessions,
+# bounded by entry count and age
+PIPELINE_CACHE_ENTRIES = int(os.environ.get("PIPELINE_CACHE_ENTRIES", 8))
+PIPELINE_CACHE_TTL = int(os.environ.get("PIPELINE_CACHE_TTL", 3600))
+# Each browser session gets its own scratch directory under here; stale ones are pruned
+SESSION_ROOT = os.environ.get("SESSION_DIR", os.path.join(tempfile.gettempdir(), "anomaly_sessions"))
+SESSION_MAX_AGE = 24 * 3600
+
+
+def session_dir():
+    """
+    Private scratch directory for this browser session. Every call marks it
+    as in use (mtime), so pruning only removes sessions idle for
+    SESSION_MAX_AGE; a session pruned while idle gets its directory back.
+    """
+    if "workdir" not in st.session_state:
+        os.makedirs(SESSION_ROOT, exist_ok=True)
+        cutoff = time.time() - SESSION_MAX_AGE
+        for name in os.listdir(SESSION_ROOT):
+            path = os.path.join(SESSION_ROOT, name)
+            try:
+                stale = os.path.getmtime(path) < cutoff
+            except FileNotFoundError:  # pruned by another session meanwhile
+                continue
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+        st.session_state["workdir"] = tempfile.mkdtemp(prefix="session_", dir=SESSION_ROOT)
+
+    workdir = st.session_state["workdir"]
+    os.makedirs(workdir, exist_ok=True)
+    os.utime(workdir)
+    return workdir
+
+
+def stage_uploads(uploaded_ts, uploaded_logs):
+    """
+    Content keys and local paths for the two uploads. Hashing and copying
+    happen once per uploaded file, not on every rerun.
+    """
+    staged = st.session_state.setdefault("staged_uploads", {})
+    key = (uploaded_ts.file_id, uploaded_logs.file_id)
+    workdir = session_dir()
+    # Staged files can disappear under an idle session (cache eviction, session pruning)
+    if key not in staged or not all(os.path.exists(staged[key][i]) for i in (0, 2)):
+        # Time-series goes through the columnar cache: parsed once per distinct upload,
+        # memory-mapped on every later rerun
+        ts_cache_path = cache_timeseries(uploaded_ts.getbuffer())
+        logs_key = content_hash(uploaded_logs.getbuffer())
+        logs_path = os.path.join(workdir, f"logs_{logs_key[:16]}.csv")
+        with open(logs_path, "wb") as f:
+            f.write(uploaded_logs.getbuffer())
+        staged.clear()
+        staged[key] = (ts_cache_path, logs_key, logs_path)
+    return staged[key]
+
+
+@st.cache_resource(max_entries=PIPELINE_CACHE_ENTRIES, ttl=PIPELINE_CACHE_TTL, show_spinner=False)
+def load_raw_timeseries(ts_cache_path):
+    """Shared read-only frame per cached upload (the cache path embeds its content hash)."""
+    return load_timeseries(ts_cache_path)
+
+
+@st.cache_data(max_entries=PIPELINE_CACHE_ENTRIES, ttl=PIPELINE_CACHE_TTL, show_spinner=False)
+def run_pipeline(ts_cache_path, logs_key, window_minutes, _logs_path, _profiler):
+    """
+    Detection pipeline for one pair of uploads. Cached on the time-series
+    cache path, the logs content hash and the parameters; `_logs_path` and
+    `_profiler` are not part of the key.
+    """
+    profiler = _profiler
+    # 1. Preprocess
+    with profiler.stage("load_timeseries") as stage:
+        raw_ts = load_raw_timeseries(ts_cache_path)
+        stage.rows_out = raw_ts
+    with profiler.stage("build_windows", rows_in=raw_ts) as stage:
+        windows = build_windows(raw_ts, window_minutes=window_minutes)
+        stage.rows_out = windows
+
+    # 2. behavioral
+    with profiler.stage("detect_behavior_anomalies", rows_in=windows) as stage:
+        windows = detect_behavior_anomalies(windows)
+        stage.rows_out = windows
+
+    # 3. structural
+    with profiler.stage("detect_structure_anomalies", rows_in=windows) as stage:
+        windows = detect_structure_anomalies(windows)
+        stage.rows_out = windows
+
+    # 4. Events
+    with profiler.stage("build_events", rows_in=windows) as stage:
+        events = build_events(windows)
+        stage.rows_out = events
+
+    # 5. Clustering
+    with profiler.stage("cluster_events", rows_in=events) as stage:
+        events = cluster_events(events)
+        stage.rows_out = events
+
+    # 6. Parse Logs
+    with profiler.stage("parse_operator_logs") as stage:
+        parsed_logs = parse_operator_logs(_logs_path)
+        stage.rows_out = parsed_logs
+    df_logs = pd.read_csv(_logs_path)
+
+    return windows, events, parsed_logs, df_logs
+
 
 st.set_page_config(page_title="Anomaly Detection Dashboard", layout="wide")
 
@@ -20,13 +135,21 @@ Upload your sensor data and operator logs to detect anomalies and correlate them
 st.sidebar.header("Configuration")
 uploaded_ts = st.sidebar.file_uploader("Upload Time-Series CSV", type=["csv"])
 uploaded_logs = st.sidebar.file_uploader("Upload Operator Logs CSV", type=["csv"])
+window_minutes = st.sidebar.number_input(
+    "Window size (minutes)", min_value=1, max_value=60, value=WINDOW_MINUTES,
+    help="Sensor samples are aggregated into windows of this length before detection."
+)
+log_padding = st.sidebar.slider(
+    "Log correlation window (± minutes)", 0, 60, LOG_PADDING_MINUTES,
+    help="Operator logs this close to an event are attached to its diagnosis."
+)
 
 # AI Diagnostic Configuration
 st.sidebar.divider()
 st.sidebar.header("AI Diagnostic Settings")
 ai_mode = st.sidebar.radio(
     "Select AI Provider",
-    ["Groq (Free)", "Gemini (Free)", "OpenAI", "Ollama (Local)"],
+    ["Groq (Free)", "Gemini (Free)", "OpenAI", "Ollama (Local)", "Stub (Offline)"],
     help="Groq and Gemini have free tiers. Ollama requires the Ollama app to be running locally.",
     index=0
 )
@@ -43,40 +166,56 @@ elif ai_mode == "OpenAI":
     st.sidebar.markdown("🤖 **OpenAI** · Model: `gpt-3.5-turbo`")
     api_key = st.sidebar.text_input("Enter OpenAI API Key", type="password")
     ai_provider = "openai"
-else:
+elif ai_mode == "Ollama (Local)":
     st.sidebar.info("🏠 **Ollama** · Model: `llama3.2:latest`\n\nEnsure Ollama is running on your machine.")
     api_key = "local_ollama"
     ai_provider = "ollama"
+else:
+    st.sidebar.info("🧪 **Stub** · Canned offline answers for testing the diagnosis panel.")
+    api_key = "stub"
+    ai_provider = "stub"
+
+fallback_routes = []
+with st.sidebar.expander("Failover Provider"):
+    fallback_mode = st.selectbox(
+        "Backup provider (hedged when the primary is slow)",
+        ["None", "Groq", "Gemini", "OpenAI", "Ollama"],
+    )
+    if fallback_mode in ("Groq", "Gemini", "OpenAI"):
+        fallback_key = st.text_input(f"{fallback_mode} API Key", type="password", key="fallback_key")
+        if fallback_key:
+            fallback_routes.append((fallback_mode.lower(), fallback_key))
+    elif fallback_mode == "Ollama":
+        fallback_routes.append(("ollama", "local_ollama"))
+
+events_per_prompt = st.sidebar.slider(
+    "Events per AI request", 1, 5, 1,
+    help="Pack several events into one prompt to cut the number of provider calls."
+)
+
+st.sidebar.divider()
+profiler = Profiler(enabled=st.sidebar.checkbox(
+    "Profile pipeline stages", value=False,
+    help="Record wall/CPU time, peak memory growth and row counts for each stage of this run."
+))
 
 if uploaded_ts and uploaded_logs:
-    # Save temporary files
-    with open("temp_ts.csv", "wb") as f:
-        f.write(uploaded_ts.getbuffer())
-    with open("temp_logs.csv", "wb") as f:
-        f.write(uploaded_logs.getbuffer())
+    ts_cache_path, logs_key, logs_path = stage_uploads(uploaded_ts, uploaded_logs)
 
     st.success("Files uploaded successfully! Processing...")
 
-    # Pipeline execution
+    # Pipeline execution: only on a new upload / parameter combination, reruns hit the cache
     with st.spinner("Running Detection Pipeline..."):
-        # 1. Preprocess
-        windows = build_windows("temp_ts.csv")
-        
-        # 2. behavioral
-        windows = detect_behavior_anomalies(windows)
-        
-        # 3. structural
-        windows = detect_structure_anomalies(windows)
-        
-        # 4. Events
-        events = build_events(windows)
-        
-        # 5. Clustering
-        events = cluster_events(events)
-        
-        # 6. Parse Logs
-        parsed_logs = parse_operator_logs("temp_logs.csv")
-        df_logs = pd.read_csv("temp_logs.csv") # Define globally for the UI block
+        recorded = len(profiler.records)
+        with profiler.stage("run_pipeline") as stage:
+            windows, events, parsed_logs, df_logs = run_pipeline(
+                ts_cache_path, logs_key, window_minutes, logs_path, profiler
+            )
+            raw_ts = load_raw_timeseries(ts_cache_path)
+            stage.rows_out = windows
+            # The profiler is not part of the cache key: a hit records no per-stage timings
+            if profiler.enabled and len(profiler.records) == recorded:
+                stage.name = "run_pipeline (cached)"
 
     st.header(" Analysis Results")
     
@@ -92,25 +231,40 @@ if uploaded_ts and uploaded_logs:
         delta_color="inverse"
     )
     m2.metric("Total Events Detected", len(events))
-    high_sev = len([e for e in events if e.get('cluster', 0) == 1])
+    high_sev = int((events.cluster == 1).sum())
     m3.metric("High Severity Alerts", high_sev, delta_color="inverse")
 
     # 1. Visualization Tabs
+    # Charts are downsampled to a fixed point budget; narrowing the range re-queries it in full detail
+    x_range = None
+    t_min = raw_ts["timestamp"].min().to_pydatetime()
+    t_max = raw_ts["timestamp"].max().to_pydatetime()
+    if t_max > t_min:
+        zoom = st.slider(
+            "Zoom time range", min_value=t_min, max_value=t_max, value=(t_min, t_max),
+            format="YYYY-MM-DD HH:mm",
+        )
+        if zoom != (t_min, t_max):
+            x_range = zoom
+
     tab1, tab2, tab3 = st.tabs(["Integrated Diagnosis", "Raw Signal Explorer", "Anomaly Score Trends"])
 
     with tab1:
         st.subheader("Interactive Event Dashboard")
-        fig_events = plot_events_and_logs(windows, events, "temp_ts.csv", "temp_logs.csv")
+        with profiler.stage("plot_events_and_logs", rows_in=events):
+            fig_events = plot_events_and_logs(windows, events, raw_ts, logs_path, x_range=x_range)
         st.plotly_chart(fig_events, width="stretch")
     
     with tab2:
         st.subheader("Raw Asynchronous Sensor Data")
-        fig_raw = plot_raw_timeseries("temp_ts.csv")
+        with profiler.stage("plot_raw_timeseries", rows_in=raw_ts):
+            fig_raw = plot_raw_timeseries(raw_ts, x_range=x_range)
         st.plotly_chart(fig_raw, width="stretch")
         
     with tab3:
         st.subheader("Behavioral & Structural Scores")
-        fig_scores = plot_anomaly_scores(windows)
+        with profiler.stage("plot_anomaly_scores", rows_in=windows):
+            fig_scores = plot_anomaly_scores(windows)
         st.plotly_chart(fig_scores, width="stretch")
 
     # 2. Event Summary Tables
@@ -118,8 +272,8 @@ if uploaded_ts and uploaded_logs:
     with col1:
         st.subheader("Detected Events")
         if events:
-            df_events = pd.DataFrame(events)
-            st.dataframe(df_events[["start", "end", "severity", "cluster"]])
+            df_events = events.to_frame()
+            st.dataframe(df_events[["start", "end", "severity", "cluster", "root_causes"]])
         else:
             st.info("No anomalies detected.")
 
@@ -131,23 +285,37 @@ if uploaded_ts and uploaded_logs:
     st.divider()
     st.header(" AI Diagnostic Reasoning")
     if events:
-        for i, event in enumerate(events):
-            with st.expander(f"Detailed Analysis: Event {i}", expanded=(i==0)):
-                e_start = pd.to_datetime(event["start"])
-                e_end = pd.to_datetime(event["end"])
-                
-                related_logs = df_logs[
-                    (pd.to_datetime(df_logs["timestamp"]) >= e_start - pd.Timedelta(minutes=5)) &
-                    (pd.to_datetime(df_logs["timestamp"]) <= e_end + pd.Timedelta(minutes=5))
-                ].to_dict('records')
-                
-                context = {
-                    "severity": "CRITICAL" if event.get('cluster', 0) == 1 else "WARNING",
-                    "behavior_score": f"{event.get('severity', 0):.4f}",
-                    "duration": event.get('duration', 'unknown'),
-                    "logs": related_logs
-                }
+        # Logs are sorted once; all events are matched in one batched lookup
+        related_by_event = LogIndex(df_logs).related_logs(events, padding_minutes=log_padding)
+        contexts = [
+            {
+                "severity": "CRITICAL" if event.cluster == 1 else "WARNING",
+                "behavior_score": f"{event.severity:.4f}",
+                "duration": event.duration,
+                "root_causes": event.root_causes,
+                "logs": related_logs
+            }
+            for event, related_logs in zip(events, related_by_event)
+        ]
+
+        # Advanced AI reasoning for all events at once: concurrent, cached calls
+        diagnoses = None
+        if api_key:
+            with st.spinner(f"Generating AI analysis for {len(contexts)} events..."):
+                # The whole panel is bounded by one budget; unanswered events fall back to the rule-based assessment
+                with profiler.stage("diagnose_events", rows_in=contexts) as stage:
+                    diagnoses = asyncio.run(diagnose_events(
+                        api_key, contexts, provider=ai_provider, batch_size=events_per_prompt,
+                        fallbacks=fallback_routes,
+                    ))
+                    stage.rows_out = diagnoses
+            latency = provider_stats.snapshot()
+            if latency:
+                with st.sidebar.expander("AI Provider Latency"):
+                    st.dataframe(pd.DataFrame(latency).T)
 
+        for i, context in enumerate(contexts):
+            with st.expander(f"Detailed Analysis: Event {i}", expanded=(i==0)):
                 # 1. Standard Rule-Based Diagnostic
                 st.markdown(f"#### Standard Diagnostic Analysis")
                 st.markdown(f"**Anomaly Type**: `{context['severity']}` Behavioral Drift")
@@ -155,29 +323,32 @@ if uploaded_ts and uploaded_logs:
                 reasoning = f"""
                 **Reasoning Engine Output**:
                 - The system detected a deviation in the **AutoEncoder reconstruction path** (Score: {context['behavior_score']}).
+                - Top contributing signals: **{format_root_causes(context['root_causes']) or 'n/a'}**.
                 - Event Duration: **{context['duration']} minutes**.
                 """
                 
-                if related_logs:
-                    log_summary = " ".join([l['log'] for l in related_logs])
-                    root_cause = f"The correlation with log entries (*'{log_summary}'*) suggests an external intervention or a known subsystem failure triggered this event."
-                else:
-                    root_cause = "No matching operator logs found. This suggests a **Silent Failure** or an internal relationship drift that was not immediately visible to human operators."
-                
+                root_cause = rule_based_assessment(context)
+
                 st.write(reasoning)
                 st.success(f"**Final Assessment**: {root_cause}")
 
                 # 2. Advanced AI Reasoning Analysis (Optional/Live)
-                if api_key:
+                if diagnoses is not None:
                     st.divider()
                     st.markdown(f"####  Advanced AI Reasoning ({ai_mode})")
-                    with st.spinner(f"Generating Analysis for Event {i}..."):
-                        from llm_service import get_ai_diagnosis
-                        real_diagnosis = get_ai_diagnosis(api_key, context, provider=ai_provider)
-                        st.markdown(real_diagnosis)
+                    st.markdown(diagnoses[i])
     else:
         st.success("System is operating within normal behavioral parameters. No active insights required.")
 
+    if profiler.records:
+        with st.sidebar.expander("Stage Timings", expanded=True):
+            if any(r["stage"] == "run_pipeline (cached)" for r in profiler.records):
+                st.caption(
+                    "Pipeline results came from the cache, so its stages did not run. "
+                    "Change an input or parameter to profile a fresh run."
+                )
+            st.dataframe(profiler.to_frame().set_index("stage"))
+
 else:
     st.info("Please upload both Time-Series Data and Operator Logs in the sidebar to begin.")
     
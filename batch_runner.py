@@ -0,0 +1,144 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from preprocessing import build_windows
+from anomaly_model import MODEL_DIR, configure_threads, detect_behavior_anomalies
+from structure_model import detect_structure_anomalies
+from event_builder import build_events
+from clustering import cluster_event_tables
+
+
+def load_manifest(source):
+    """
+    Assets to process as [(asset_id, csv_path), ...]. `source` is a directory
+    of per-asset CSVs (asset id = file name), a CSV manifest with
+    `asset_id,path` columns, or a JSON object {asset_id: path}.
+    """
+    if os.path.isdir(source):
+        return [
+            (os.path.splitext(name)[0], os.path.join(source, name))
+            for name in sorted(os.listdir(source)) if name.endswith(".csv")
+        ]
+
+    base = os.path.dirname(os.path.abspath(source))
+    if source.endswith(".json"):
+        with open(source) as f:
+            items = json.load(f).items()
+    else:
+        manifest = pd.read_csv(source)
+        items = zip(manifest["asset_id"].astype(str), manifest["path"])
+    return [(asset_id, os.path.join(base, path)) for asset_id, path in items]
+
+
+def _init_worker(threads):
+    # One small torch pool per process; N workers x default pools would oversubscribe the cores
+    configure_threads(threads, 1)
+
+
+def run_asset(asset_id, csv_path, model_dir=MODEL_DIR):
+    """
+    Detection pipeline for one asset, up to unclustered events. Returns
+    (EventTable, per-stage timings); clustering runs in the parent process.
+    """
+    timings = {"asset_id": asset_id}
+
+    def stage(name, fn, *args, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings[name] = time.perf_counter() - started
+        return result
+
+    windows = stage("windows", build_windows, csv_path)
+    windows = stage("behavior", detect_behavior_anomalies, windows, model_dir=model_dir)
+    windows = stage("structure", detect_structure_anomalies, windows)
+    events = stage("events", build_events, windows)
+
+    timings["n_windows"] = len(windows)
+    timings["n_events"] = len(events)
+    timings["total"] = sum(v for k, v in timings.items() if k in ("windows", "behavior", "structure", "events"))
+    return events, timings
+
+
+def _run_asset_safe(asset_id, csv_path, model_dir):
+    try:
+        return run_asset(asset_id, csv_path, model_dir)
+    except Exception as e:
+        traceback.print_exc()
+        return None, {"asset_id": asset_id, "error": f"{type(e).__name__}: {e}"}
+
+
+def run_assets(assets, workers=None, threads_per_worker=None, output=None, model_dir=MODEL_DIR):
+    """
+    Run the pipeline for every (asset_id, csv_path) in a process pool.
+    Events from all assets are then clustered here, in asset order, with one
+    shared cluster model in `model_dir`, and written to `output` (CSV).
+    Returns the combined events and a per-asset timing table.
+    """
+    cpus = os.cpu_count() or 1
+    workers = workers or min(cpus, max(1, len(assets)))
+    threads_per_worker = threads_per_worker or max(1, cpus // workers)
+
+    results, timings = {}, []
+    started = time.perf_counter()
+    # spawn: forking a process that already started torch thread pools can deadlock
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(threads_per_worker,),
+    ) as pool:
+        futures = [pool.submit(_run_asset_safe, asset_id, path, model_dir) for asset_id, path in assets]
+        for future in as_completed(futures):
+            events, timing = future.result()
+            timings.append(timing)
+            if events is None:
+                print(f"[Batch] {timing['asset_id']}: FAILED ({timing['error']})")
+                continue
+            print(f"[Batch] {timing['asset_id']}: {timing['n_events']} events "
+                  f"from {timing['n_windows']} windows in {timing['total']:.2f}s")
+            results[timing["asset_id"]] = events
+
+    # Workers sharing one model file would each fix its scaling from their own first
+    # asset and overwrite each other's updates; one process folds every asset in instead
+    clustering_started = time.perf_counter()
+    asset_ids = [asset_id for asset_id, _ in assets if asset_id in results]
+    model_path = os.path.join(model_dir, "event_clusters.joblib")
+    tables = cluster_event_tables([results[asset_id] for asset_id in asset_ids], model_path)
+    frames = []
+    for asset_id, events in zip(asset_ids, tables):
+        frame = events.to_frame()
+        frame.insert(0, "asset_id", asset_id)
+        frames.append(frame)
+    print(f"[Batch] Clustered {sum(len(t) for t in tables)} events in {time.perf_counter() - clustering_started:.2f}s")
+
+    elapsed = time.perf_counter() - started
+    print(f"[Batch] {len(assets)} assets in {elapsed:.2f}s with {workers} workers x {threads_per_worker} torch threads")
+
+    events = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if output:
+        events.to_csv(output, index=False)
+    return events, pd.DataFrame(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the detection pipeline for many assets in parallel.")
+    parser.add_argument("source", help="Directory of per-asset CSVs, or a CSV/JSON manifest")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--output", default="combined_events.csv")
+    parser.add_argument("--timings", default="asset_timings.csv")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    args = parser.parse_args()
+
+    _, timing_table = run_assets(
+        load_manifest(args.source), args.workers, args.threads_per_worker, args.output, args.model_dir
+    )
+    timing_table.to_csv(args.timings, index=False)
+    print(f"Events: {args.output}  Timings: {args.timings}")
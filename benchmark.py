@@ -0,0 +1,361 @@
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import WINDOW_MINUTES, aggregate_windows, build_windows, fill_gaps, resample
+from structure_model import detect_structure_anomalies, structure_scores
+from event_builder import build_events
+from generate_data import ANOMALY_TYPES, generate_timeseries
+from profiling import Profiler
+
+# Pipeline results accumulate here, one JSON line per (version, size)
+RESULTS_PATH = "benchmark_results.jsonl"
+# (signals, minutes, samples per minute)
+PIPELINE_SIZES = [(4, 60, 1), (20, 1440, 6), (50, 10080, 2)]
+
+
+def make_timeseries(n_signals, minutes, samples_per_minute, seed=42):
+    """Asynchronous long-format frame (signal_id, timestamp, value) without anomalies."""
+    df, _ = generate_timeseries(
+        n_signals, minutes, samples_per_minute,
+        jitter_seconds=30 / samples_per_minute, anomalies=[], seed=seed,
+    )
+    return df
+
+
+def legacy_build_windows(df, window_minutes=WINDOW_MINUTES):
+    """
+    The original per-window, per-signal loop, kept as the reference engine.
+    Gaps go through the same causal fill_gaps as the vectorized engine (the
+    loop's ffill+bfill leaked later samples into leading windows).
+    """
+    df = df.copy()
+    df["window"] = df["timestamp"].dt.floor(f"{window_minutes}min")
+
+    windows = []
+    for window, group in df.groupby("window"):
+        row = {"window": window}
+        for signal in group["signal_id"].unique():
+            vals = group[group["signal_id"] == signal]["value"]
+            row[f"{signal}_mean"] = vals.mean()
+            row[f"{signal}_std"] = vals.std() if len(vals) > 1 else 0
+            row[f"{signal}_last"] = vals.iloc[-1]
+        windows.append(row)
+
+    return fill_gaps(pd.DataFrame(windows))
+
+
+def _time(fn, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def bench_windows(sizes, repeat=3):
+    print(f"{'signals':>8} {'minutes':>8} {'rows':>10} {'legacy_s':>10} {'vector_s':>10} {'speedup':>8}")
+    for n_signals, minutes, rate in sizes:
+        df = make_timeseries(n_signals, minutes, rate)
+        # One signal starts late, so both engines also see leading gaps
+        start = df["timestamp"].min() + pd.Timedelta(minutes=5)
+        df = df[(df["signal_id"] != df["signal_id"].iloc[-1]) | (df["timestamp"] >= start)]
+        t_old, old = _time(legacy_build_windows, df, repeat=repeat)
+        t_new, new = _time(aggregate_windows, df, repeat=repeat)
+        pd.testing.assert_frame_equal(old, new, check_dtype=False)
+        print(f"{n_signals:>8} {minutes:>8} {len(df):>10} {t_old:>10.3f} {t_new:>10.3f} {t_old / t_new:>7.1f}x")
+
+
+def bench_resample(sizes, repeat=3):
+    """Time-weighted resampler: all default resolutions in one pass vs the floor engine at one resolution."""
+    print(f"{'signals':>8} {'minutes':>8} {'rows':>10} {'floor_1min_s':>13} {'resample_s':>11}  resolutions")
+    for n_signals, minutes, rate in sizes:
+        df, _ = generate_timeseries(n_signals, minutes, rate, jitter_seconds=30 / rate, anomalies=0, seed=0)
+        t_floor, _ = _time(aggregate_windows, df, repeat=repeat)
+        t_res, frames = _time(resample, df, repeat=repeat)
+        shapes = ", ".join(f"{res}: {len(frame)}" for res, frame in frames.items())
+        print(f"{n_signals:>8} {minutes:>8} {len(df):>10} {t_floor:>13.3f} {t_res:>11.3f}  {shapes}")
+
+
+def _peak_memory(fn, *args, **kwargs):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn(*args, **kwargs)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+def bench_streaming(n_signals, minutes, samples_per_minute, chunksize=100_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "timeseries.csv")
+        make_timeseries(n_signals, minutes, samples_per_minute).to_csv(path, index=False)
+        size_mb = os.path.getsize(path) / 2**20
+
+        t_full, mem_full = _peak_memory(build_windows, path)
+        t_chunk, mem_chunk = _peak_memory(build_windows, path, chunksize=chunksize)
+
+    print(f"CSV {size_mb:.1f} MB: in-memory {t_full:.2f}s / {mem_full:.0f} MB peak, "
+          f"chunked({chunksize}) {t_chunk:.2f}s / {mem_chunk:.0f} MB peak")
+
+
+def legacy_structure_scores(df, window_size=5):
+    """The original per-row pandas .corr() loop, kept as the reference scorer."""
+    signal_cols = list(df.columns)
+    scores = []
+    for i in range(len(df)):
+        if i < window_size:
+            scores.append(0.0)
+            continue
+        history = df.iloc[i - window_size:i][signal_cols]
+        baseline_corr = history.corr().fillna(0).values
+        current_window = df.iloc[max(0, i - 1):i + 1][signal_cols]
+        current_corr = current_window.corr().fillna(0).values
+        scores.append(np.abs(current_corr - baseline_corr).mean())
+    return np.array(scores)
+
+
+def bench_structure(sizes, repeat=3):
+    print(f"{'rows':>8} {'signals':>8} {'legacy_s':>10} {'f64_s':>10} {'f32_s':>10} {'max_err_f64':>12} {'max_err_f32':>12}")
+    rng = np.random.default_rng(0)
+    for n, k in sizes:
+        # Random walks with a few flat stretches, like forward-filled signals
+        X = np.cumsum(rng.normal(size=(n, k)), axis=0)
+        X[n // 3:n // 3 + 20, : k // 2] = X[n // 3, : k // 2]
+        df = pd.DataFrame(X)
+        t_old, old = _time(legacy_structure_scores, df, repeat=1)
+        t_64, new_64 = _time(structure_scores, X, 5, np.float64, repeat=repeat)
+        t_32, new_32 = _time(structure_scores, X, 5, np.float32, repeat=repeat)
+        err_64 = np.abs(old - new_64).max()
+        err_32 = np.abs(old - new_32).max()
+        print(f"{n:>8} {k:>8} {t_old:>10.3f} {t_64:>10.4f} {t_32:>10.4f} {err_64:>12.2e} {err_32:>12.2e}")
+
+
+def bench_online(n_signals, minutes, samples_per_minute):
+    from anomaly_model import train_behavior_model
+    from online_detector import StreamingDetector
+
+    df = make_timeseries(n_signals, minutes, samples_per_minute)
+    windows = aggregate_windows(df)
+    model = train_behavior_model(windows, epochs=50)
+    detector = StreamingDetector.from_windows(model, windows)
+
+    records = list(df[["signal_id", "timestamp", "value"]].itertuples(index=False, name=None))
+    t0 = time.perf_counter()
+    detector.update_many(records)
+    detector.flush()
+    elapsed = time.perf_counter() - t0
+    print(f"Online detector: {len(records)} samples, {len(windows)} windows, "
+          f"{elapsed / len(records) * 1e6:.1f} us/sample, {elapsed / len(windows) * 1e3:.2f} ms/window")
+
+
+def legacy_build_events(df):
+    """The original iterrows() segmenter, kept as the reference."""
+    events = []
+    current_event = None
+    for _, row in df.iterrows():
+        if row["behavior_anomaly"] or row["structure_anomaly"]:
+            if current_event is None:
+                current_event = {"start": row["window"], "end": row["window"], "severity": 0.0}
+            current_event["end"] = row["window"]
+            current_event["severity"] += row["behavior_score"]
+        elif current_event:
+            delta = pd.to_datetime(current_event["end"]) - pd.to_datetime(current_event["start"])
+            current_event["duration"] = max(1, int(delta.total_seconds() / 60))
+            events.append(current_event)
+            current_event = None
+    if current_event:
+        delta = pd.to_datetime(current_event["end"]) - pd.to_datetime(current_event["start"])
+        current_event["duration"] = max(1, int(delta.total_seconds() / 60))
+        events.append(current_event)
+    return events
+
+
+def make_scored_windows(n, anomaly_rate=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "window": pd.date_range("2024-01-01", periods=n, freq="1min"),
+        "behavior_score": rng.exponential(1.0, n),
+        "behavior_anomaly": rng.random(n) < anomaly_rate,
+        "structure_anomaly": rng.random(n) < anomaly_rate,
+    })
+
+
+def bench_events(sizes, repeat=3):
+    print(f"{'windows':>8} {'events':>8} {'legacy_s':>10} {'vector_s':>10} {'speedup':>8}")
+    for n in sizes:
+        df = make_scored_windows(n)
+        t_old, old = _time(legacy_build_events, df, repeat=1)
+        t_new, new = _time(build_events, df, repeat=repeat)
+        new = new.to_dicts()
+        assert len(old) == len(new)
+        for a, b in zip(old, new):
+            assert (a["start"], a["end"], a["duration"]) == (b["start"], b["end"], b["duration"])
+            assert np.isclose(a["severity"], b["severity"], rtol=1e-12)
+        print(f"{n:>8} {len(new):>8} {t_old:>10.3f} {t_new:>10.4f} {t_old / t_new:>7.0f}x")
+
+
+def _label_hits(starts, ends, labels_start, labels_end):
+    """For each [start, end) interval: does it overlap any of the sorted, disjoint label intervals?"""
+    idx = np.searchsorted(labels_start, ends, side="left") - 1
+    valid = idx >= 0
+    hits = np.zeros(len(starts), dtype=bool)
+    hits[valid] = labels_end[idx[valid]] > starts[valid]
+    return hits
+
+
+def score_detection(windows, events, labels, window_minutes=WINDOW_MINUTES):
+    """Window- and event-level precision/recall against ground-truth label intervals."""
+    step = np.timedelta64(window_minutes, "m")
+    l_start = labels["start"].to_numpy(dtype="datetime64[ns]")
+    l_end = labels["end"].to_numpy(dtype="datetime64[ns]")
+    w_start = windows["window"].to_numpy(dtype="datetime64[ns]")
+
+    truth = _label_hits(w_start, w_start + step, l_start, l_end)
+    flagged = (windows["behavior_anomaly"] | windows["structure_anomaly"]).to_numpy(dtype=bool)
+
+    e_start, e_end = events.start, events.end + step
+    event_hits = _label_hits(e_start, e_end, l_start, l_end)
+    label_hits = _label_hits(l_start, l_end, e_start, e_end)
+
+    def ratio(a, b):
+        return round(float(a) / b, 4) if b else None
+
+    return {
+        "window_precision": ratio((flagged & truth).sum(), flagged.sum()),
+        "window_recall": ratio((flagged & truth).sum(), truth.sum()),
+        "event_precision": ratio(event_hits.sum(), len(event_hits)),
+        "event_recall": ratio(label_hits.sum(), len(label_hits)),
+    }
+
+
+def _version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def bench_pipeline(sizes=PIPELINE_SIZES, results_path=RESULTS_PATH, seed=0):
+    """
+    End-to-end run on generated data with labeled anomalies: per-stage wall
+    time plus precision/recall. Each size appends one record to `results_path`.
+    """
+    from anomaly_model import detect_behavior_anomalies
+    from clustering import cluster_events
+
+    version = _version()
+    print(f"{'size':>14} {'rows':>10} {'windows_s':>10} {'behavior_s':>10} {'structure_s':>11} "
+          f"{'events_s':>9} {'cluster_s':>9} {'w_prec':>7} {'w_rec':>7} {'e_prec':>7} {'e_rec':>7}")
+    for n_signals, minutes, rate in sizes:
+        df, labels = generate_timeseries(
+            n_signals, minutes, rate, jitter_seconds=30 / rate,
+            anomalies=max(2, minutes // 120), anomaly_types=ANOMALY_TYPES, correlation=0.5, seed=seed,
+        )
+        profiler = Profiler(dump_dir=None)
+        # Fresh model dir so every run pays (and times) training
+        with tempfile.TemporaryDirectory() as model_dir:
+            with profiler.stage("windows", rows_in=df) as stage:
+                windows = build_windows(df)
+                stage.rows_out = windows
+            with profiler.stage("behavior", rows_in=windows):
+                windows = detect_behavior_anomalies(windows, model_dir=model_dir)
+            with profiler.stage("structure", rows_in=windows):
+                windows = detect_structure_anomalies(windows)
+            with profiler.stage("events", rows_in=windows) as stage:
+                events = build_events(windows)
+                stage.rows_out = events
+            with profiler.stage("clustering", rows_in=events):
+                events = cluster_events(events, model_path=os.path.join(model_dir, "event_clusters.joblib"))
+
+        record = {
+            "version": version,
+            "size": f"{n_signals}x{minutes}x{rate}",
+            "rows": len(df),
+            "labels": len(labels),
+            "stages": {r["stage"]: r["wall_s"] for r in profiler.records},
+            **score_detection(windows, events, labels),
+        }
+        with open(results_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+        t = record["stages"]
+        print(f"{record['size']:>14} {record['rows']:>10} {t['windows']:>10.3f} {t['behavior']:>10.3f} "
+              f"{t['structure']:>11.3f} {t['events']:>9.4f} {t['clustering']:>9.3f} "
+              f"{record['window_precision']!s:>7} {record['window_recall']!s:>7} "
+              f"{record['event_precision']!s:>7} {record['event_recall']!s:>7}")
+    return version
+
+
+def check_regressions(results_path=RESULTS_PATH, version=None, baseline=None, tolerance=1.25, recall_drop=0.05):
+    """
+    Compare the latest records of `version` against `baseline` (default: the
+    previous version in the results file). Flags stages slower than
+    `tolerance` x baseline and recall drops larger than `recall_drop`.
+    """
+    with open(results_path) as f:
+        results = pd.DataFrame([json.loads(line) for line in f if line.strip()])
+    versions = list(dict.fromkeys(results["version"]))
+    version = version or versions[-1]
+    if baseline is None:
+        earlier = [v for v in versions[:versions.index(version)] if v != version]
+        if not earlier:
+            print(f"No baseline recorded before {version}")
+            return []
+        baseline = earlier[-1]
+
+    current = results[results["version"] == version].groupby("size").last()
+    base = results[results["version"] == baseline].groupby("size").last()
+    regressions = []
+    for size in current.index.intersection(base.index):
+        for stage, t in current.at[size, "stages"].items():
+            t0 = base.at[size, "stages"].get(stage)
+            # Sub-10ms stages are dominated by timer noise
+            if t0 and max(t, t0) > 0.01 and t > tolerance * t0:
+                regressions.append(f"{size} {stage}: {t0:.3f}s -> {t:.3f}s ({t / t0:.2f}x)")
+        for metric in ("window_recall", "event_recall"):
+            r, r0 = current.at[size, metric], base.at[size, metric]
+            if r is not None and r0 is not None and r < r0 - recall_drop:
+                regressions.append(f"{size} {metric}: {r0:.3f} -> {r:.3f}")
+
+    print(f"Regressions {baseline} -> {version}: {len(regressions) or 'none'}")
+    for line in regressions:
+        print(f"  {line}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic data.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--suite", choices=["components", "pipeline", "all"], default="all",
+                        help="components: each stage against its legacy implementation; "
+                             "pipeline: end-to-end timings and precision/recall, stored for regression checks")
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=None, help="Version to compare against (default: previous in results)")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args()
+
+    if args.suite in ("components", "all"):
+        bench_windows([(4, 60, 1), (20, 600, 6), (100, 1440, 6)], repeat=args.repeat)
+        bench_streaming(50, 1440, 30)
+        bench_resample([(4, 60, 1), (20, 1440, 6), (50, 1440, 30)], repeat=args.repeat)
+        bench_structure([(1000, 4), (1000, 50), (10000, 4), (10000, 50), (5000, 200)], repeat=args.repeat)
+        bench_online(20, 600, 60)
+        bench_events([1_000, 10_000, 100_000], repeat=args.repeat)
+
+    if args.suite in ("pipeline", "all"):
+        version = bench_pipeline(results_path=args.results)
+        check_regressions(args.results, version, args.baseline, args.tolerance)
@@ -1,15 +1,141 @@
-from sklearn.cluster import KMeans
+import hashlib
+import os
+from collections import deque
+
+import joblib
 import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+N_CLUSTERS = 2
+# Columns of the per-event feature matrix (see event_features)
+FEATURES = ("severity", "duration", "peak_behavior", "peak_structure", "concentration")
+# Fitted centroids, feature scaling and the label map persist here between runs
+CLUSTER_MODEL_PATH = os.environ.get(
+    "CLUSTER_MODEL_PATH", os.path.join(os.environ.get("MODEL_DIR", "models"), "event_clusters.joblib")
+)
+# Batches already learned are remembered so reruns on the same events do not re-weight them
+MAX_SEEN_BATCHES = 1000
+
+# Clusterers loaded in this process, by path
+_loaded = {}
+
+
+def event_features(events):
+    """(n_events, len(FEATURES)) matrix; heavy-tailed magnitudes are log-scaled."""
+    return np.column_stack((
+        np.log1p(np.maximum(events.severity, 0.0)),
+        np.log1p(events.duration.astype(np.float64)),
+        np.log1p(np.maximum(events.peak_behavior, 0.0)),
+        events.peak_structure,
+        events.concentration,
+    ))
+
+
+class EventClusterer:
+    """
+    Incremental k-means over standardized event features. Each new batch of
+    events is folded in with MiniBatchKMeans.partial_fit; labels are the
+    clusters' severity rank (0 = mildest, N_CLUSTERS - 1 = most severe), so
+    "cluster 1 = high severity" holds regardless of k-means' internal order.
+    """
+
+    def __init__(self, n_clusters=N_CLUSTERS, seed=42):
+        self.n_clusters = n_clusters
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, n_init=3)
+        self.mean = None
+        self.scale = None
+        self.rank = None
+        self.seen = deque(maxlen=MAX_SEEN_BATCHES)
+
+    @property
+    def fitted(self):
+        return self.rank is not None
+
+    @property
+    def centroids(self):
+        """Cluster centres in feature units, ordered by severity rank."""
+        centers = self.kmeans.cluster_centers_ * self.scale + self.mean
+        return centers[np.argsort(self.rank)]
 
-def cluster_events(events):
-    if len(events) < 2:
+    def partial_fit(self, X):
+        """Fold a batch into the model; returns False if it was already learned or too small."""
+        digest = hashlib.sha1(np.ascontiguousarray(X).tobytes()).hexdigest()
+        if digest in self.seen or (not self.fitted and len(X) < self.n_clusters):
+            return False
+
+        if self.mean is None:
+            # Scaling is fixed by the first batch so centroids stay comparable across updates
+            self.mean = X.mean(axis=0)
+            std = X.std(axis=0)
+            self.scale = np.where(std > 0, std, 1.0)
+        self.kmeans.partial_fit((X - self.mean) / self.scale)
+        self.seen.append(digest)
+
+        # Rank clusters by their severity coordinate
+        order = np.argsort(self.kmeans.cluster_centers_[:, 0], kind="stable")
+        self.rank = np.empty(self.n_clusters, dtype=np.int64)
+        self.rank[order] = np.arange(self.n_clusters)
+        return True
+
+    def predict(self, X):
+        """Severity-rank labels from the stored centroids (plain NumPy, no refit)."""
+        Z = (X - self.mean) / self.scale
+        distances = ((Z[:, None, :] - self.kmeans.cluster_centers_[None, :, :]) ** 2).sum(axis=2)
+        return self.rank[distances.argmin(axis=1)]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(self, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        return joblib.load(path)
+
+
+def load_clusterer(path=CLUSTER_MODEL_PATH):
+    """Clusterer for `path`: cached in-process, else read from disk, else a fresh one."""
+    if path not in _loaded:
+        clusterer = None
+        if os.path.exists(path):
+            try:
+                clusterer = EventClusterer.load(path)
+            except Exception as e:  # stale pickle from another library version
+                print(f"[Clustering] Ignoring unreadable model {path}: {e}")
+        _loaded[path] = clusterer or EventClusterer()
+    return _loaded[path]
+
+
+def cluster_events(events, model_path=CLUSTER_MODEL_PATH, update=True):
+    """
+    Assign each event its severity-rank cluster. With `update`, the events
+    are first folded into the persisted model (once per distinct batch);
+    with update=False they are only classified against it.
+    """
+    if len(events) == 0:
         return events
 
-    X = np.array([[e["severity"]] for e in events])
-    kmeans = KMeans(n_clusters=2, random_state=42)
-    labels = kmeans.fit_predict(X)
+    clusterer = load_clusterer(model_path)
+    X = event_features(events)
+    if update and clusterer.partial_fit(X):
+        clusterer.save(model_path)
+    if clusterer.fitted:
+        events.cluster[:] = clusterer.predict(X)
+
+    return events
 
-    for event, label in zip(events, labels):
-        event["cluster"] = int(label)
 
-    return events
\ No newline at end of file
+def cluster_event_tables(tables, model_path=CLUSTER_MODEL_PATH, update=True):
+    """
+    cluster_events for several EventTables (e.g. one per asset) sharing one
+    model: each table is folded in, in order, and the model is saved once;
+    then every table is labelled against the final centroids, so all labels
+    come from the same model.
+    """
+    clusterer = load_clusterer(model_path)
+    if update:
+        changed = [clusterer.partial_fit(event_features(events)) for events in tables if len(events)]
+        if any(changed):
+            clusterer.save(model_path)
+    return [cluster_events(events, model_path, update=False) for events in tables]
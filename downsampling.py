@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+# Points per trace sent to the browser: about one per horizontal pixel of a wide chart
+MAX_POINTS_PER_TRACE = 2000
+
+
+def _minmax_indices(y, n_buckets):
+    """Positions of the min and max of `y` in each of `n_buckets` equal buckets (sorted, unique)."""
+    size = -(-len(y) // n_buckets)
+    n_buckets = -(-len(y) // size)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:len(y)] = y
+    padded = padded.reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    picks = np.concatenate((offsets + np.nanargmin(padded, axis=1), offsets + np.nanargmax(padded, axis=1)))
+    # Keep the endpoints so the reduced series spans the same x range
+    return np.unique(np.concatenate(([0], picks, [len(y) - 1])))
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: positions of `n_out` points of (x, y)
+    that keep the visual shape of the series. First and last points are
+    always kept; `x` must be sorted.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Mean of each bucket, plus the last point as the final "next bucket"
+    counts = np.maximum(np.diff(np.append(edges, n)), 1)
+    mean_x = np.add.reduceat(x, edges) / counts
+    mean_y = np.add.reduceat(y, edges) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        cx, cy = mean_x[i + 1], mean_y[i + 1]
+        # Twice the triangle area (a, candidate, next-bucket mean); the constant factor does not matter
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(x, y, n_out=MAX_POINTS_PER_TRACE):
+    """
+    Indices of at most `n_out` points of a sorted series. Long series are
+    first reduced to their per-bucket min/max (vectorized), so the LTTB
+    pass only ever sees ~4 * n_out points and cost stays flat as data grows.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) <= n_out:
+        return np.arange(len(x))
+    candidates = np.arange(len(x))
+    if len(x) > 4 * n_out:
+        candidates = _minmax_indices(y, 2 * n_out)
+    return candidates[lttb(x[candidates], y[candidates], n_out)]
+
+
+def downsample_frame(df, x="timestamp", y="value", by=None, x_range=None, n_out=MAX_POINTS_PER_TRACE):
+    """
+    Rows of `df` kept for plotting: restricted to `x_range` (t0, t1) if
+    given, then LTTB-downsampled to `n_out` points per `by` group. Zooming
+    in on a narrower range therefore returns more detail for that range.
+    """
+    times = df[x].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    # float32 columns stay float32 here; only the per-group slices are widened
+    values = df[y].to_numpy()
+    mask = ~np.isnan(values)
+    if x_range is not None:
+        mask &= (times >= pd.Timestamp(x_range[0]).value) & (times <= pd.Timestamp(x_range[1]).value)
+    rows = np.flatnonzero(mask)
+
+    bounds = [0, len(rows)]
+    if by:
+        # Integer codes in order of first appearance, then one stable sort to split rows per group
+        codes = pd.factorize(df[by])[0][rows]
+        if codes.size and codes.max() < np.iinfo(np.int16).max:
+            codes = codes.astype(np.int16)  # stable sort of 16-bit keys is a radix sort
+        order = np.argsort(codes, kind="stable")
+        rows = rows[order]
+        bounds = [0, *(np.flatnonzero(np.diff(codes[order])) + 1), len(rows)]
+
+    # Gather once; each group is then a contiguous slice
+    times, values = times[rows], values[rows]
+    keep = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        group, t, v = rows[lo:hi], times[lo:hi], values[lo:hi]
+        if np.any(t[1:] < t[:-1]):
+            order = np.argsort(t, kind="stable")
+            group, t, v = group[order], t[order], v[order]
+        keep.append(group[downsample(t.astype(np.float64), v, n_out)])
+    return df.iloc[np.concatenate(keep) if keep else rows]
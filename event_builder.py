@@ -1,33 +1,135 @@
+import numpy as np
 import pandas as pd
 
-def build_events(df):
-    events = []
-    current_event = None
-
-    for _, row in df.iterrows():
-        # High-sensitivity: trigger on either behavioral OR structural anomaly
-        is_anomaly = row["behavior_anomaly"] or row["structure_anomaly"]
-
-        if is_anomaly:
-            if current_event is None:
-                current_event = {
-                    "start": row["window"],
-                    "end": row["window"],
-                    "severity": 0.0
-                }
-            current_event["end"] = row["window"]
-            current_event["severity"] += row["behavior_score"]
-        else:
-            if current_event:
-                # Calculate duration in minutes
-                delta = pd.to_datetime(current_event["end"]) - pd.to_datetime(current_event["start"])
-                current_event["duration"] = max(1, int(delta.total_seconds() / 60))
-                events.append(current_event)
-                current_event = None
-
-    if current_event:
-        delta = pd.to_datetime(current_event["end"]) - pd.to_datetime(current_event["start"])
-        current_event["duration"] = max(1, int(delta.total_seconds() / 60))
-        events.append(current_event)
-
-    return events
\ No newline at end of file
+from event_store import TOP_SIGNALS, EventTable
+from feature_matrix import FeatureMatrix
+from preprocessing import ERROR_SUFFIX
+
+
+def find_runs(mask, max_gap=0):
+    """
+    Start/end positions (inclusive) of runs of True in a boolean array.
+    Runs separated by at most `max_gap` False entries are merged into one.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+
+    if max_gap and len(starts) > 1:
+        gaps = starts[1:] - ends[:-1] - 1
+        split = gaps > max_gap
+        starts = starts[np.concatenate(([True], split))]
+        ends = ends[np.concatenate((split, [True]))]
+
+    return starts, ends
+
+
+def deviation_reference(means):
+    """Per-signal median and MAD scale (1.0 where the MAD is 0) of a (windows x signals) block of means."""
+    median = np.median(means, axis=0)
+    mad = 1.4826 * np.median(np.abs(means - median), axis=0)
+    return median, np.where(mad > 0, mad, 1.0)
+
+
+def signal_deviation(df):
+    """
+    Per-window, per-signal robust z-score of the window means (distance from
+    the run median in MAD units) of a window frame or FeatureMatrix.
+    Returns (matrix, signal names).
+    """
+    features = df if isinstance(df, FeatureMatrix) else FeatureMatrix.from_frame(df)
+    values = features.stat("mean").astype(np.float64)
+    median, scale = deviation_reference(values)
+    return np.abs(values - median) / scale, features.signals
+
+
+def signal_concentration(deviation_totals):
+    """Largest single-signal share of each row of per-event deviation totals (0 for all-zero rows)."""
+    if deviation_totals.shape[1] == 0:
+        return np.zeros(len(deviation_totals))
+    sums = deviation_totals.sum(axis=1)
+    return np.divide(deviation_totals.max(axis=1), sums, out=np.zeros_like(sums), where=sums > 0)
+
+
+def signal_errors(df):
+    """Per-window, per-signal reconstruction error columns. Returns (matrix, signal names)."""
+    columns = [c for c in df.columns if c.endswith(ERROR_SUFFIX)]
+    return df[columns].to_numpy(dtype=np.float32), [c[:-len(ERROR_SUFFIX)] for c in columns]
+
+
+def top_contributors(totals, k=TOP_SIGNALS):
+    """
+    Column positions of the `k` largest entries per row of `totals`, largest
+    first, and their share of the row sum. Rows with fewer than `k` columns
+    and zero contributions are padded with -1 / 0.
+    """
+    n, m = totals.shape
+    codes = np.full((n, k), -1, dtype=np.int16)
+    shares = np.zeros((n, k), dtype=np.float32)
+    if m == 0:
+        return codes, shares
+    kk = min(k, m)
+    top = np.argpartition(-totals, kk - 1, axis=1)[:, :kk] if m > kk else np.tile(np.arange(m), (n, 1))
+    values = np.take_along_axis(totals, top, axis=1)
+    order = np.argsort(-values, axis=1, kind="stable")
+    top, values = np.take_along_axis(top, order, axis=1), np.take_along_axis(values, order, axis=1)
+    sums = totals.sum(axis=1, keepdims=True)
+    valid = sums[:, 0] > 0
+    codes[valid, :kk] = top[valid]
+    shares[valid, :kk] = values[valid] / sums[valid]
+    codes[shares == 0] = -1
+    return codes, shares
+
+
+def build_events(df, max_gap=0):
+    """
+    Group consecutive anomalous windows into events.
+
+    A window is anomalous if either its behavioral OR structural flag is set
+    (high sensitivity). Set `max_gap` to join runs separated by up to that
+    many normal windows; severity and the peak scores only use the
+    anomalous windows. `concentration` is the largest single-signal share
+    of the event's signal deviation (1.0 = one signal explains it all).
+    The top contributing signals come from the {signal}_error columns of
+    detect_behavior_anomalies (the signal deviation if they are missing).
+    Returns an EventTable.
+    """
+    is_anomaly = (df["behavior_anomaly"] | df["structure_anomaly"]).to_numpy(dtype=bool)
+    starts, ends = find_runs(is_anomaly, max_gap)
+    if len(starts) == 0:
+        return EventTable()
+
+    # Per-event reductions over [start, end]: reduceat on (start, end + 1) pairs, every other slot
+    bounds = np.column_stack((starts, ends + 1)).ravel()
+
+    def per_event(ufunc, values):
+        return ufunc.reduceat(np.concatenate((values, np.zeros((1,) + values.shape[1:]))), bounds)[::2]
+
+    # Severity: per-event sum of behavior_score over its anomalous windows
+    behavior = np.where(is_anomaly, df["behavior_score"].to_numpy(dtype=np.float64), 0.0)
+    severity = per_event(np.add, behavior)
+    peak_behavior = per_event(np.maximum, behavior)
+    structure = df["structure_score"].to_numpy(dtype=np.float64) if "structure_score" in df else np.zeros(len(df))
+    peak_structure = per_event(np.maximum, np.where(is_anomaly, structure, 0.0))
+
+    deviation, signals = signal_deviation(df)
+    deviation_totals = per_event(np.add, np.where(is_anomaly[:, None], deviation, 0.0))
+
+    errors, error_signals = signal_errors(df)
+    totals = deviation_totals
+    if errors.shape[1]:
+        totals, signals = per_event(np.add, np.where(is_anomaly[:, None], errors, 0.0)), error_signals
+    top_signals, top_shares = top_contributors(totals)
+
+    windows = pd.DatetimeIndex(df["window"])
+    start = windows[starts]
+    end = windows[ends]
+    # Calculate duration in minutes
+    duration = np.maximum(1, ((end - start).total_seconds() / 60).astype(np.int64))
+
+    return EventTable.from_arrays(
+        start, end, severity, duration, signals=signals,
+        peak_behavior=peak_behavior, peak_structure=peak_structure, concentration=signal_concentration(deviation_totals),
+        top_signals=top_signals, top_shares=top_shares,
+    )
@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+
+# Contributing signals kept per event
+TOP_SIGNALS = 3
+
+EVENT_DTYPE = np.dtype([
+    ("start", "datetime64[ns]"),
+    ("end", "datetime64[ns]"),
+    ("severity", "float64"),
+    ("duration", "int64"),
+    ("cluster", "int64"),
+    ("peak_behavior", "float64"),
+    ("peak_structure", "float64"),
+    ("concentration", "float64"),
+    # Root cause: positions in EventTable.signals of the top contributing
+    # signals (-1 = unused slot) and their share of the event's error
+    ("top_signals", "int16", (TOP_SIGNALS,)),
+    ("top_shares", "float32", (TOP_SIGNALS,)),
+])
+
+# Scalar columns; the root-cause slots are exposed as Event.root_causes
+FIELDS = tuple(name for name in EVENT_DTYPE.names if not EVENT_DTYPE[name].shape)
+KEYS = FIELDS + ("root_causes",)
+
+
+class Event:
+    """Read-only view of one row of an EventTable (supports event["start"] and event.get too)."""
+
+    __slots__ = ("_table", "_i")
+
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+
+    @property
+    def index(self):
+        return self._i
+
+    @property
+    def start(self):
+        return pd.Timestamp(self._table.data["start"][self._i])
+
+    @property
+    def end(self):
+        return pd.Timestamp(self._table.data["end"][self._i])
+
+    @property
+    def severity(self):
+        return float(self._table.data["severity"][self._i])
+
+    @property
+    def duration(self):
+        return int(self._table.data["duration"][self._i])
+
+    @property
+    def cluster(self):
+        return int(self._table.data["cluster"][self._i])
+
+    @property
+    def peak_behavior(self):
+        return float(self._table.data["peak_behavior"][self._i])
+
+    @property
+    def peak_structure(self):
+        return float(self._table.data["peak_structure"][self._i])
+
+    @property
+    def concentration(self):
+        return float(self._table.data["concentration"][self._i])
+
+    @property
+    def root_causes(self):
+        """[(signal, share), ...] of the top contributing signals, largest first."""
+        codes = self._table.data["top_signals"][self._i]
+        shares = self._table.data["top_shares"][self._i]
+        return [(self._table.signals[c], float(s)) for c, s in zip(codes, shares) if c >= 0]
+
+    def __getitem__(self, key):
+        if key not in KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in KEYS else default
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in KEYS}
+
+    def __repr__(self):
+        return f"Event({self.to_dict()})"
+
+
+class EventTable:
+    """
+    Array-backed event store: one structured NumPy array with start, end,
+    severity, duration and cluster columns plus the peak scores and signal
+    concentration used for clustering, and the top contributing signals as
+    codes into `signals` (about 80 bytes per event).
+    """
+
+    def __init__(self, data=None, signals=()):
+        self.data = np.zeros(0, dtype=EVENT_DTYPE) if data is None else np.asarray(data, dtype=EVENT_DTYPE)
+        self.signals = list(signals)
+        # build_events emits disjoint, time-ordered events; then both start and
+        # end are sorted and interval queries are two binary searches.
+        self._sorted = bool(
+            np.all(self.data["start"][1:] >= self.data["start"][:-1])
+            and np.all(self.data["end"][1:] >= self.data["end"][:-1])
+        )
+
+    @classmethod
+    def from_arrays(cls, start, end, severity, duration, cluster=None, signals=(), **columns):
+        """
+        Build from column arrays; optional `columns` fill any other EVENT_DTYPE
+        field. `top_signals` codes index into `signals`.
+        """
+        data = np.zeros(len(start), dtype=EVENT_DTYPE)
+        data["top_signals"] = -1
+        data["start"] = start
+        data["end"] = end
+        data["severity"] = severity
+        data["duration"] = duration
+        if cluster is not None:
+            data["cluster"] = cluster
+        for name, values in columns.items():
+            data[name] = values
+        return cls(data, signals)
+
+    @classmethod
+    def from_dicts(cls, events):
+        """Build from dicts with the FIELDS keys and optional "root_causes" [(signal, share), ...]."""
+        events = sorted(events, key=lambda e: pd.Timestamp(e["start"]))
+        signals = list(dict.fromkeys(s for e in events for s, _ in e.get("root_causes", ())))
+        codes = {s: i for i, s in enumerate(signals)}
+        top_signals = np.full((len(events), TOP_SIGNALS), -1, dtype=np.int16)
+        top_shares = np.zeros((len(events), TOP_SIGNALS), dtype=np.float32)
+        for i, e in enumerate(events):
+            for j, (signal, share) in enumerate(e.get("root_causes", ())[:TOP_SIGNALS]):
+                top_signals[i, j] = codes[signal]
+                top_shares[i, j] = share
+        return cls.from_arrays(
+            pd.to_datetime([e["start"] for e in events]),
+            pd.to_datetime([e["end"] for e in events]),
+            [e["severity"] for e in events],
+            [e.get("duration", 1) for e in events],
+            [e.get("cluster", 0) for e in events],
+            signals=signals,
+            top_signals=top_signals,
+            top_shares=top_shares,
+            **{name: [e.get(name, 0.0) for e in events] for name in FIELDS[5:]},
+        )
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return (Event(self, i) for i in range(len(self.data)))
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return Event(self, range(len(self.data))[i])
+        return EventTable(self.data[i], self.signals)
+
+    def __repr__(self):
+        return f"EventTable({len(self)} events)"
+
+    @property
+    def start(self):
+        return self.data["start"]
+
+    @property
+    def end(self):
+        return self.data["end"]
+
+    @property
+    def severity(self):
+        return self.data["severity"]
+
+    @property
+    def duration(self):
+        return self.data["duration"]
+
+    @property
+    def cluster(self):
+        return self.data["cluster"]
+
+    @property
+    def peak_behavior(self):
+        return self.data["peak_behavior"]
+
+    @property
+    def peak_structure(self):
+        return self.data["peak_structure"]
+
+    @property
+    def concentration(self):
+        return self.data["concentration"]
+
+    @property
+    def top_signals(self):
+        return self.data["top_signals"]
+
+    @property
+    def top_shares(self):
+        return self.data["top_shares"]
+
+    def overlapping(self, t0, t1):
+        """Events whose [start, end] interval intersects [t0, t1]."""
+        t0 = np.datetime64(pd.Timestamp(t0), "ns")
+        t1 = np.datetime64(pd.Timestamp(t1), "ns")
+        if self._sorted:
+            lo = np.searchsorted(self.data["end"], t0, side="left")
+            hi = np.searchsorted(self.data["start"], t1, side="right")
+            return EventTable(self.data[lo:max(lo, hi)], self.signals)
+        mask = (self.data["start"] <= t1) & (self.data["end"] >= t0)
+        return EventTable(self.data[mask], self.signals)
+
+    def root_cause_labels(self):
+        """One "signal 62%, signal 21%" string per event."""
+        return [", ".join(f"{s} {share:.0%}" for s, share in event.root_causes) for event in self]
+
+    def to_frame(self):
+        frame = pd.DataFrame({name: self.data[name] for name in FIELDS})
+        frame["root_causes"] = self.root_cause_labels()
+        return frame
+
+    def to_dicts(self):
+        return [event.to_dict() for event in self]
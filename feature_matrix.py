@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from preprocessing import STATS
+
+
+def parse_column(column):
+    """"{signal}_{stat}" -> (signal, stat), or None for any other column."""
+    if not isinstance(column, str):
+        return None
+    signal, _, stat = column.rpartition("_")
+    return (signal, stat) if signal and stat in STATS else None
+
+
+def feature_columns(columns, stats=STATS):
+    """The {signal}_{stat} window feature columns among `columns` (for the given `stats`), in order."""
+    return [c for c in columns if (parse_column(c) or (None, None))[1] in stats]
+
+
+class FeatureMatrix:
+    """
+    Window features as one float32 (n_windows, n_features) block (row-major
+    as build_windows lays it out) plus its column names and window
+    timestamps. Columns are parsed
+    into (signal, stat) once; `stat("mean")` is a strided view when the
+    layout is the regular {signal}_mean/_std/_last one build_windows emits.
+
+    The block is shared, not owned: a matrix taken from a window frame is a
+    read-only view of the frame's data, and `to_frame` hands the block back
+    to pandas without copying. Stages that need scaled or widened values
+    make their own copy.
+    """
+
+    def __init__(self, values, columns, index=None):
+        self.values = np.asarray(values, dtype=np.float32)
+        self.columns = list(columns)
+        self.index = pd.DatetimeIndex(index) if index is not None else None
+        parsed = [parse_column(c) for c in self.columns]
+        self.signals = list(dict.fromkeys(p[0] for p in parsed if p))
+        self._positions = {
+            stat: np.array([i for i, p in enumerate(parsed) if p and p[1] == stat], dtype=np.int64)
+            for stat in STATS
+        }
+
+    @classmethod
+    def from_frame(cls, df, columns=None, time_column="window"):
+        """
+        `columns` (default: every {signal}_{stat} column) of a window frame.
+        Frames from build_windows or `to_frame` hold these columns as one
+        float32 block, which is wrapped without copying (a strided view for
+        a subset of it); other dtypes are copied into a new block.
+        """
+        columns = feature_columns(df.columns) if columns is None else list(columns)
+        index = df[time_column] if time_column in df else None
+        return cls(df[columns].to_numpy(), columns, index)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def stat(self, name):
+        """(n_windows, n_signals) block of one statistic; a view when the positions are evenly spaced."""
+        positions = self._positions[name]
+        step = positions[1] - positions[0] if len(positions) > 1 else 1
+        if len(positions) and step > 0 and np.all(np.diff(positions) == step):
+            return self.values[:, positions[0]:positions[-1] + 1:step]
+        return self.values[:, positions]
+
+    def column(self, name):
+        return self.values[:, self.columns.index(name)]
+
+    def to_frame(self):
+        """Window frame ("window" + feature columns) backed by this block, no copy."""
+        frame = pd.DataFrame(self.values, columns=self.columns, copy=False)
+        if self.index is not None:
+            frame.insert(0, "window", self.index)
+        return frame
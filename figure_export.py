@@ -0,0 +1,88 @@
+import argparse
+import glob
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import plotly.io as pio
+
+DASHBOARD_HTML = "anomaly_dashboard.html"
+DASHBOARD_PNG = "anomaly_events_plot.png"
+# Default directory for CLI exports
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "exports")
+
+# One background worker: exports queue up behind each other and share one Kaleido browser
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="figure-export")
+_kaleido_lock = threading.Lock()
+_kaleido_started = False
+
+
+def _start_kaleido():
+    """Start Kaleido's persistent browser once per process (Kaleido >= 1) instead of once per image."""
+    global _kaleido_started
+    with _kaleido_lock:
+        if _kaleido_started:
+            return
+        import kaleido
+        if hasattr(kaleido, "start_sync_server"):
+            # Constructing Kaleido raises right away without Chrome; a server started
+            # without it dies in its thread and leaves every later write waiting
+            kaleido.Kaleido()
+            kaleido.start_sync_server(silence_warnings=True)
+        # Kaleido 0.x: plotly keeps its own subprocess
+        _kaleido_started = True
+
+
+def write_figures(jobs):
+    """
+    Write (figure, path) pairs; the format comes from each path's extension
+    (.html, or any image format Kaleido supports). All images go to Kaleido
+    in one batch. Blocking; returns the written paths.
+    """
+    images = []
+    for fig, path in jobs:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if path.endswith(".html"):
+            fig.write_html(path)
+        else:
+            images.append((fig, path))
+
+    if images:
+        _start_kaleido()
+        figs, paths = zip(*images)
+        if hasattr(pio, "write_images"):
+            pio.write_images(list(figs), list(paths))
+        else:
+            for fig, path in images:
+                fig.write_image(path)
+
+    paths = [path for _, path in jobs]
+    print(f"[Export] Saved: {', '.join(paths)}")
+    return paths
+
+
+def export_in_background(jobs):
+    """Queue `write_figures(jobs)` on the export thread. Returns a Future (call .result() to wait / surface errors)."""
+    return _executor.submit(write_figures, list(jobs))
+
+
+def export_dashboard(fig, html_path=DASHBOARD_HTML, image_path=DASHBOARD_PNG, background=True):
+    """Static copies of the events dashboard. Pass None for a path to skip that output."""
+    jobs = [(fig, path) for path in (html_path, image_path) if path]
+    return export_in_background(jobs) if background else write_figures(jobs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch-export Plotly figure JSON files to HTML and/or images.")
+    parser.add_argument("figures", nargs="+", help="Figure JSON files (fig.write_json) or glob patterns")
+    parser.add_argument("--formats", default="html,png", help="Comma-separated output formats")
+    parser.add_argument("--out-dir", default=EXPORT_DIR)
+    args = parser.parse_args()
+
+    sources = [path for pattern in args.figures for path in sorted(glob.glob(pattern))]
+    jobs = []
+    for source in sources:
+        fig = pio.read_json(source)
+        stem = os.path.splitext(os.path.basename(source))[0]
+        jobs += [(fig, os.path.join(args.out_dir, f"{stem}.{fmt}")) for fmt in args.formats.split(",")]
+    write_figures(jobs)
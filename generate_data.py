@@ -1,52 +1,228 @@
+import argparse
+import os
+
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-
-def generate_data():
-    start_time = datetime(2024, 1, 1, 10, 0, 0)
-    data = []
-    
-    signals = {
-        "motor_temp": {"base": 45, "noise": 1.0},
-        "vibration": {"base": 0.5, "noise": 0.05},
-        "pressure": {"base": 30, "noise": 0.5},
-        "rpm": {"base": 1500, "noise": 10}
-    }
-    
-    # Generate 60 minutes of data
-    for i in range(60):
-        ts = start_time + timedelta(minutes=i)
-        
-        for name, params in signals.items():
-            val = params["base"] + np.random.normal(0, params["noise"])
-            
-            # Anomaly 1: Sudden spike at 10:15 - 10:20
-            if 15 <= i <= 20:
-                if name == "motor_temp": val += 40
-                if name == "vibration": val += 2.5
-                if name == "pressure": val += 30
-                if name == "rpm": val -= 800
-            
-            # Anomaly 2: Gradual drift at 10:40 - 10:45
-            if 40 <= i <= 45:
-                if name == "motor_temp": val += (i - 40) * 5
-                if name == "vibration": val += (i - 40) * 0.2
-            
-            data.append({"signal_id": name, "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"), "value": val})
-
-    pd.DataFrame(data).to_csv("data/timeseries.csv", index=False)
-    print("Generated 60 minutes of data with 2 anomalies in data/timeseries.csv")
-
-    logs = [
-        {"timestamp": "2024-01-01 10:05:00", "log": "System health check passed. All parameters nominal."},
-        {"timestamp": "2024-01-01 10:15:30", "log": "Acoustic sensor picked up unusual grinding noise."},
-        {"timestamp": "2024-01-01 10:17:00", "log": "Thermal alerts triggered on motor housing."},
-        {"timestamp": "2024-01-01 10:21:00", "log": "Manual override engaged to stabilize RPM."},
-        {"timestamp": "2024-01-01 10:42:00", "log": "Operator noted slight increase in housing temperature."},
-        {"timestamp": "2024-01-01 10:50:00", "log": "Routine maintenance completed after drift observation."}
-    ]
-    pd.DataFrame(logs).to_csv("data/operator_logs.csv", index=False)
-    print("Updated data/operator_logs.csv")
+
+START_TIME = "2024-01-01 10:00:00"
+
+# The first signals keep the demo names; any extra ones are signal_<i> with random levels
+SIGNALS = {
+    "motor_temp": {"base": 45, "noise": 1.0},
+    "vibration": {"base": 0.5, "noise": 0.05},
+    "pressure": {"base": 30, "noise": 0.5},
+    "rpm": {"base": 1500, "noise": 10}
+}
+
+# spike: additive offset, drift: offset per minute, stuck: value frozen,
+# decouple: sign of the shared component flipped (needs correlation > 0)
+ANOMALY_TYPES = ("spike", "drift", "stuck", "decouple")
+
+# The original demo scenario. start/end are minutes from the start, end exclusive;
+# magnitude maps signal -> amount in signal units (only the keys matter for stuck/decouple).
+DEMO_ANOMALIES = [
+    # Sudden spike at 10:15 - 10:20
+    {"type": "spike", "start": 15, "end": 21,
+     "magnitude": {"motor_temp": 40, "vibration": 2.5, "pressure": 30, "rpm": -800}},
+    # Gradual drift at 10:40 - 10:45
+    {"type": "drift", "start": 40, "end": 46,
+     "magnitude": {"motor_temp": 5, "vibration": 0.2}},
+]
+
+DEMO_LOGS = [
+    {"timestamp": "2024-01-01 10:05:00", "log": "System health check passed. All parameters nominal."},
+    {"timestamp": "2024-01-01 10:15:30", "log": "Acoustic sensor picked up unusual grinding noise."},
+    {"timestamp": "2024-01-01 10:17:00", "log": "Thermal alerts triggered on motor housing."},
+    {"timestamp": "2024-01-01 10:21:00", "log": "Manual override engaged to stabilize RPM."},
+    {"timestamp": "2024-01-01 10:42:00", "log": "Operator noted slight increase in housing temperature."},
+    {"timestamp": "2024-01-01 10:50:00", "log": "Routine maintenance completed after drift observation."}
+]
+
+# Operator notes written during / after generated anomalies, by type
+LOG_TEMPLATES = {
+    "spike": "Thermal alerts triggered on motor housing.",
+    "drift": "Operator noted slight increase in housing temperature.",
+    "stuck": "Gauge reading frozen, RPM display not updating.",
+    "decouple": "Unusual vibration pattern, pressure out of sync with load.",
+}
+RECOVERY_LOG = "Cooling engaged, system stabilized."
+HEALTH_LOG = "System health check passed. All parameters nominal."
+
+
+def signal_table(n_signals, rng):
+    """Names, base levels and noise levels for `n_signals` signals."""
+    names = list(SIGNALS)[:n_signals]
+    base = [SIGNALS[name]["base"] for name in names]
+    noise = [SIGNALS[name]["noise"] for name in names]
+
+    extra = n_signals - len(names)
+    if extra > 0:
+        names += [f"signal_{i}" for i in range(len(SIGNALS), n_signals)]
+        extra_base = rng.uniform(1, 100, extra)
+        base += list(extra_base)
+        noise += list(extra_base * rng.uniform(0.01, 0.05, extra))
+
+    return names, np.array(base, dtype=np.float64), np.array(noise, dtype=np.float64)
+
+
+def random_anomalies(n_anomalies, names, noise, minutes, rng, types=ANOMALY_TYPES[:3],
+                     min_duration=3, max_duration=15, region=(0.25, 1.0)):
+    """
+    `n_anomalies` non-overlapping anomaly specs placed in `region` (fractions
+    of the run; the default leaves the first quarter clean for model training).
+    Magnitudes are 8-15 noise standard deviations.
+    """
+    lo, hi = int(region[0] * minutes), int(region[1] * minutes)
+    slot = (hi - lo) // max(n_anomalies, 1)
+    if n_anomalies and slot < min_duration + 1:
+        raise ValueError(f"{n_anomalies} anomalies of >= {min_duration} min do not fit in {hi - lo} minutes")
+
+    specs = []
+    for i in range(n_anomalies):
+        kind = types[rng.integers(len(types))]
+        duration = int(rng.integers(min_duration, min(max_duration, slot - 1) + 1))
+        start = lo + i * slot + int(rng.integers(0, slot - duration))
+        n_affected = int(rng.integers(1, max(1, len(names) // 2) + 1))
+        affected = np.sort(rng.choice(len(names), n_affected, replace=False))
+
+        sigmas = rng.uniform(8, 15, n_affected) * rng.choice([-1, 1], n_affected)
+        if kind == "drift":
+            sigmas /= duration
+        specs.append({
+            "type": kind,
+            "start": start,
+            "end": start + duration,
+            "magnitude": {names[j]: float(s * noise[j]) for j, s in zip(affected, sigmas)},
+        })
+    return specs
+
+
+def generate_timeseries(n_signals=4, minutes=60, samples_per_minute=1, jitter_seconds=0.0,
+                        anomalies=None, anomaly_types=ANOMALY_TYPES[:3], correlation=0.0,
+                        start=START_TIME, seed=None):
+    """
+    Synthetic asynchronous sensor data, built as one (signals x samples)
+    array so millions of rows take seconds.
+
+    `anomalies` is a list of specs (see DEMO_ANOMALIES), a count of random
+    ones, or None for the demo scenario. `jitter_seconds` shifts each sample
+    independently (per signal) to make the streams asynchronous;
+    `correlation` couples all signals through a shared component.
+    Returns (long-format frame, ground-truth labels frame).
+    """
+    rng = np.random.default_rng(seed)
+    names, base, noise = signal_table(n_signals, rng)
+    n = minutes * samples_per_minute
+    t_min = np.arange(n) / samples_per_minute
+
+    shared = rng.standard_normal(n)
+    z = correlation * shared + np.sqrt(1 - correlation ** 2) * rng.standard_normal((n_signals, n))
+    values = base[:, None] + noise[:, None] * z
+
+    if anomalies is None:
+        anomalies = DEMO_ANOMALIES
+    elif isinstance(anomalies, int):
+        anomalies = random_anomalies(anomalies, names, noise, minutes, rng, types=anomaly_types)
+
+    index = {name: i for i, name in enumerate(names)}
+    labels = []
+    for spec in anomalies:
+        rows = [index[name] for name in spec["magnitude"] if name in index]
+        if not rows:
+            continue
+        mag = np.array([spec["magnitude"][names[r]] for r in rows], dtype=np.float64)[:, None]
+        lo, hi = np.searchsorted(t_min, [spec["start"], spec["end"]])
+        block = np.ix_(rows, np.arange(lo, hi))
+
+        if spec["type"] == "spike":
+            values[block] += mag
+        elif spec["type"] == "drift":
+            values[block] += mag * (t_min[lo:hi] - spec["start"])
+        elif spec["type"] == "stuck":
+            values[block] = values[rows, max(lo - 1, 0)][:, None]
+        elif spec["type"] == "decouple":
+            values[block] -= 2 * correlation * noise[rows, None] * shared[lo:hi]
+        else:
+            raise ValueError(f"Unknown anomaly type: {spec['type']}")
+
+        labels.append({
+            "type": spec["type"],
+            "start": pd.Timestamp(start) + pd.Timedelta(minutes=spec["start"]),
+            "end": pd.Timestamp(start) + pd.Timedelta(minutes=spec["end"]),
+            "signals": ";".join(names[r] for r in rows),
+        })
+
+    offsets = np.broadcast_to(t_min * 60, (n_signals, n))
+    if jitter_seconds:
+        offsets = np.clip(offsets + rng.uniform(-jitter_seconds, jitter_seconds, offsets.shape), 0, minutes * 60 - 1e-3)
+    times = pd.Timestamp(start).value + np.round(offsets * 1e3).astype(np.int64) * 1_000_000
+
+    # Interleave all signals in time order (stable: ties keep signal order)
+    order = np.argsort(times.ravel(), kind="stable")
+    codes = np.repeat(np.arange(n_signals), n)[order]
+    df = pd.DataFrame({
+        "signal_id": pd.Categorical.from_codes(codes, categories=names),
+        "timestamp": pd.to_datetime(times.ravel()[order]),
+        "value": values.ravel()[order],
+    })
+    labels = pd.DataFrame(labels, columns=["type", "start", "end", "signals"])
+    labels.insert(0, "anomaly_id", np.arange(len(labels)))
+    return df, labels
+
+
+def generate_logs(labels, minutes, start=START_TIME, seed=None):
+    """Operator logs for generated labels: hourly health checks plus a note during and after each anomaly."""
+    rng = np.random.default_rng(seed)
+    checks = pd.Timestamp(start) + pd.to_timedelta(np.arange(5, minutes, 60), unit="min")
+    logs = [{"timestamp": t, "log": HEALTH_LOG} for t in checks]
+
+    for row in labels.itertuples(index=False):
+        span = (row.end - row.start).total_seconds()
+        noted = row.start + pd.Timedelta(seconds=float(rng.uniform(0, span)))
+        logs.append({"timestamp": noted, "log": LOG_TEMPLATES[row.type]})
+        logs.append({"timestamp": row.end + pd.Timedelta(minutes=1), "log": RECOVERY_LOG})
+
+    logs = pd.DataFrame(logs, columns=["timestamp", "log"]).sort_values("timestamp", ignore_index=True)
+    logs["timestamp"] = logs["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    return logs
+
+
+def generate_data(out_dir="data", minutes=60, anomalies=None, seed=None, **kwargs):
+    """Write timeseries.csv, operator_logs.csv and labels.csv. Defaults reproduce the demo data."""
+    os.makedirs(out_dir, exist_ok=True)
+    df, labels = generate_timeseries(minutes=minutes, anomalies=anomalies, seed=seed, **kwargs)
+
+    df.to_csv(os.path.join(out_dir, "timeseries.csv"), index=False)
+    labels.to_csv(os.path.join(out_dir, "labels.csv"), index=False)
+    print(f"Generated {minutes} minutes x {df['signal_id'].nunique()} signals ({len(df)} rows) "
+          f"with {len(labels)} anomalies in {out_dir}/timeseries.csv")
+
+    logs = pd.DataFrame(DEMO_LOGS) if anomalies is None else generate_logs(labels, minutes, seed=seed)
+    logs.to_csv(os.path.join(out_dir, "operator_logs.csv"), index=False)
+    print(f"Updated {out_dir}/operator_logs.csv")
+
 
 if __name__ == "__main__":
-    generate_data()
+    parser = argparse.ArgumentParser(description="Generate synthetic sensor data, operator logs and anomaly labels.")
+    parser.add_argument("--out-dir", default="data")
+    parser.add_argument("--signals", type=int, default=4)
+    parser.add_argument("--minutes", type=int, default=60)
+    parser.add_argument("--rate", type=int, default=1, help="Samples per minute per signal")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Max per-sample timestamp jitter (seconds)")
+    parser.add_argument("--anomalies", type=int, default=None, help="Number of random anomalies (default: demo scenario)")
+    parser.add_argument("--types", default="spike,drift,stuck", help=f"Comma-separated subset of {','.join(ANOMALY_TYPES)}")
+    parser.add_argument("--correlation", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    generate_data(
+        out_dir=args.out_dir,
+        minutes=args.minutes,
+        anomalies=args.anomalies,
+        seed=args.seed,
+        n_signals=args.signals,
+        samples_per_minute=args.rate,
+        jitter_seconds=args.jitter,
+        anomaly_types=tuple(args.types.split(",")),
+        correlation=args.correlation,
+    )
@@ -1,31 +1,103 @@
+import csv
+import json
+import os
+import re
+
+import numpy as np
 import pandas as pd
 
+UNKNOWN = "unknown"
+
+# Categories in priority order: a log matching several is assigned the first.
+# Keywords are case-insensitive substrings.
+DEFAULT_RULES = [
+    ("pressure instability", ["pressure", "exceeded"]),
+    ("thermal response issue", ["temperature", "thermal"]),
+    ("mechanical anomaly", ["vibration", "rpm", "dropped"]),
+    ("recovery action", ["cooling", "stabilized", "normal"]),
+]
 
-def parse_operator_logs(csv_path):
-    logs = pd.read_csv(csv_path)
-    parsed = []
+# Optional rule table that replaces DEFAULT_RULES without code changes
+RULES_PATH = os.environ.get("LOG_RULES_PATH")
 
-    for _, row in logs.iterrows():
-        text = row["log"].lower()
 
-        if any(word in text for word in ["pressure", "exceeded"]):
-            issue = "pressure instability"
+def load_rules(path):
+    """
+    Read a rule table. JSON: {"category": ["keyword", ...], ...} or a list of
+    [category, [keywords]] pairs. CSV: `category,keyword` rows. Priority
+    follows the order in which categories first appear.
+    """
+    if path.endswith(".json"):
+        with open(path) as f:
+            data = json.load(f)
+        items = data.items() if isinstance(data, dict) else data
+        return [(category, list(keywords)) for category, keywords in items]
 
-        elif any(word in text for word in ["temperature", "thermal"]):
-            issue = "thermal response issue"
+    rules = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            # A row without a keyword yields "", which LogClassifier drops
+            rules.setdefault(row["category"].strip(), []).append((row["keyword"] or "").strip())
+    return list(rules.items())
 
-        elif any(word in text for word in ["vibration", "rpm", "dropped"]):
-            issue = "mechanical anomaly"
 
-        elif any(word in text for word in ["cooling", "stabilized", "normal"]):
-            issue = "recovery action"
+class LogClassifier:
+    """
+    Rule table compiled once into one case-insensitive pattern per category.
+    Classification runs as vectorized string ops over a whole column. Blank
+    keywords are dropped (an empty pattern would match every log), and so
+    are categories left without any.
+    """
 
+    def __init__(self, rules=None):
+        if rules is None:
+            rules = load_rules(RULES_PATH) if RULES_PATH else DEFAULT_RULES
+        rules = [(category, [k for k in keywords if k.strip()]) for category, keywords in rules]
+        for category, keywords in rules:
+            if not keywords:
+                print(f"Log rule '{category}' has no keywords, skipping it")
+        rules = [(category, keywords) for category, keywords in rules if keywords]
+        self.categories = [category for category, _ in rules] + [UNKNOWN]
+        self.patterns = [
+            "|".join(re.escape(keyword.lower()) for keyword in keywords)
+            for _, keywords in rules
+        ]
+
+    def classify(self, texts):
+        """Series of log texts -> categorical Series of issue types."""
+        lowered = texts.fillna("").astype(str).str.lower()
+        matches = [lowered.str.contains(p, regex=True).to_numpy(dtype=bool) for p in self.patterns]
+        if matches:
+            # np.select picks the first matching category, i.e. rule priority
+            codes = np.select(matches, np.arange(len(self.patterns)), default=len(self.patterns))
         else:
-            issue = "unknown"
+            codes = np.zeros(len(texts), dtype=np.int64)
+        return pd.Series(
+            pd.Categorical.from_codes(codes, categories=self.categories),
+            index=texts.index,
+        )
 
-        parsed.append({
-            "timestamp": row["timestamp"],
-            "issue_type": issue
-        })
 
-    return parsed
\ No newline at end of file
+def parse_operator_logs(csv_path, rules=None, chunksize=None):
+    """
+    Categorize operator logs. Returns a DataFrame with the original
+    `timestamp` and a categorical `issue_type`. Pass `chunksize` to stream
+    large archives through the classifier.
+    """
+    classifier = LogClassifier(rules)
+
+    if chunksize:
+        chunks = pd.read_csv(csv_path, usecols=["timestamp", "log"], chunksize=chunksize)
+    else:
+        chunks = [pd.read_csv(csv_path, usecols=["timestamp", "log"])]
+
+    parsed = [
+        pd.DataFrame({"timestamp": chunk["timestamp"], "issue_type": classifier.classify(chunk["log"])})
+        for chunk in chunks
+    ]
+    if not parsed:
+        return pd.DataFrame({
+            "timestamp": pd.Series(dtype=object),
+            "issue_type": pd.Categorical([], categories=classifier.categories),
+        })
+    return pd.concat(parsed, ignore_index=True)
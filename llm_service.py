@@ -1,15 +1,58 @@
+import asyncio
+import hashlib
 import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def get_ai_diagnosis(api_key, context, provider="groq"):
-    """
-    Hybrid diagnostic service supporting Groq, Gemini, OpenAI, and local Ollama.
-    """
+SYSTEM_PROMPT = "You are a concise technical diagnostic assistant for industrial anomaly detection systems."
+
+PROVIDER_MODELS = {
+    "groq": "llama-3.1-8b-instant",  # Updated to current Llama 3.1
+    "openai": "gpt-3.5-turbo",  # requested by user
+    "ollama": "llama3.2:latest",  # requested by user
+    "gemini": "gemini-2.0-flash",
+    "stub": "stub",
+}
+
+# Models found in diagnostic script
+GEMINI_MODELS = [
+    "gemini-2.0-flash",
+    "gemini-2.5-flash",
+    "gemini-flash-latest",
+    "gemini-2.0-flash-lite",
+    "gemini-pro-latest",
+    "gemini-1.5-flash-latest",
+    "gemini-1.5-flash"
+]
+
+# Per-call deadlines (seconds); the SDK clients get the same value as their timeout
+PROVIDER_TIMEOUTS = {"groq": 10, "openai": 15, "gemini": 15, "ollama": 30, "stub": 1}
+# Total time the diagnosis panel waits before falling back to the rule-based assessment
+DIAGNOSIS_BUDGET_SECONDS = 20
+# Start the next provider if the current one has not answered within this time
+HEDGE_AFTER_SECONDS = 4
+
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", ".llm_cache.sqlite")
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+CACHE_MAX_ENTRIES = 5000
+MAX_CONCURRENCY = 4
 
-    # 1. Prepare common prompt
+
+def format_root_causes(root_causes):
+    """[(signal, share), ...] -> "motor_temp (62%), vibration (21%)"."""
+    return ", ".join(f"{signal} ({share:.0%})" for signal, share in root_causes)
+
+
+def build_prompt(context):
     logs_str = "\n".join([f"- {l['timestamp']}: {l['log']}" for l in context['logs']]) if context['logs'] else "No operator logs available."
-    prompt = f"""Analyze these system anomaly data points:
+    root_causes = format_root_causes(context.get('root_causes', ())) or "n/a"
+    return f"""Analyze these system anomaly data points:
 - CLASSIFICATION: {context['severity']}
 - RECONSTRUCTION ERROR: {context['behavior_score']}
+- TOP CONTRIBUTING SIGNALS (share of error): {root_causes}
 - DURATION: {context['duration']} min
 
 OPERATOR LOGS:
@@ -18,81 +61,380 @@ OPERATOR LOGS:
 TASK: Provide a brief Root Cause, Reasoning, and Recommended Actions. Keep it under 150 words.
 """
 
-    # 2. Routing Logic
-    try:
-        if provider == "groq":
-            from groq import Groq
-            client = Groq(api_key=api_key)
-            response = client.chat.completions.create(
-                model="llama-3.1-8b-instant",  # Updated to current Llama 3.1
-                messages=[
-                    {"role": "system", "content": "You are a concise technical diagnostic assistant for industrial anomaly detection systems."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=300
+
+def rule_based_assessment(context):
+    """Root-cause sentence from the rule-based engine (no LLM involved)."""
+    attribution = ""
+    if context.get('root_causes'):
+        attribution = f"The deviation is driven mainly by **{format_root_causes(context['root_causes'])}**. "
+    if context['logs']:
+        log_summary = " ".join([l['log'] for l in context['logs']])
+        return attribution + f"The correlation with log entries (*'{log_summary}'*) suggests an external intervention or a known subsystem failure triggered this event."
+    return attribution + "No matching operator logs found. This suggests a **Silent Failure** or an internal relationship drift that was not immediately visible to human operators."
+
+
+def build_batch_prompt(contexts):
+    """Pack several events into one prompt; the answer is split on '### Event N' headers."""
+    sections = [f"### Event {i + 1}\n{build_prompt(c)}" for i, c in enumerate(contexts)]
+    return (
+        f"You will diagnose {len(contexts)} independent anomaly events.\n"
+        "Answer each one under its own '### Event N' header, in order, using the same numbering.\n\n"
+        + "\n".join(sections)
+    )
+
+
+def split_batch_response(text, count):
+    parts = re.split(r"^\s*#{2,4}\s*Event\s+(\d+)\s*:?\s*$", text, flags=re.MULTILINE | re.IGNORECASE)
+    answers = {}
+    for number, body in zip(parts[1::2], parts[2::2]):
+        answers.setdefault(int(number), body.strip())
+    if all(n in answers for n in range(1, count + 1)):
+        return [answers[n] for n in range(1, count + 1)]
+    # The model ignored the format; every event gets the full answer
+    return [text] * count
+
+
+class DiagnosisCache:
+    """
+    Persistent response cache keyed by hash(provider, model, prompt), stored
+    in SQLite with a TTL and least-recently-used eviction past `max_entries`.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS diagnoses ("
+            "key TEXT PRIMARY KEY, response TEXT, created REAL, accessed REAL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(provider, model, prompt):
+        return hashlib.sha256(f"{provider}\0{model}\0{prompt}".encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, created FROM diagnoses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM diagnoses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE diagnoses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO diagnoses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
             )
-            return response.choices[0].message.content
-
-        elif provider == "gemini":
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
-            
-            # Models found in diagnostic script
-            models_to_try = [
-                "gemini-2.0-flash",
-                "gemini-2.5-flash",
-                "gemini-flash-latest",
-                "gemini-2.0-flash-lite",
-                "gemini-pro-latest",
-                "gemini-1.5-flash-latest",
-                "gemini-1.5-flash"
-            ]
-            
-            last_error = None
-            for model_name in models_to_try:
-                try:
-                    # The SDK usually handles both 'model-name' and 'models/model-name'
-                    model = genai.GenerativeModel(model_name)
-                    response = model.generate_content(prompt)
-                    return response.text
-                except Exception as e:
-                    last_error = e
-                    error_msg = str(e).lower()
-                    if "404" in error_msg or "not found" in error_msg or "not supported" in error_msg:
-                        continue 
-                    break 
-            
-            raise last_error if last_error else Exception("Gemini models unavailable.")
-
-        elif provider == "openai":
-            from openai import OpenAI
-            client = OpenAI(api_key=api_key)
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo", # requested by user
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300
+            self._db.execute("DELETE FROM diagnoses WHERE created < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM diagnoses WHERE key IN ("
+                "SELECT key FROM diagnoses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
             )
-            return response.choices[0].message.content
+            self._db.commit()
+
+
+class ProviderStats:
+    """Per (provider, model) call counts, errors and latency (EWMA and max)."""
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, provider, model, seconds, error=None):
+        with self._lock:
+            s = self._stats.setdefault((provider, model), {
+                "calls": 0, "errors": 0, "ewma_seconds": seconds, "max_seconds": 0.0, "last_error": None,
+            })
+            s["calls"] += 1
+            s["ewma_seconds"] += self.alpha * (seconds - s["ewma_seconds"])
+            s["max_seconds"] = max(s["max_seconds"], seconds)
+            if error is not None:
+                s["errors"] += 1
+                s["last_error"] = str(error)[:200]
+
+    def snapshot(self):
+        with self._lock:
+            return {f"{p}/{m}": dict(s) for (p, m), s in self._stats.items()}
+
+
+class RouterError(Exception):
+    pass
 
-        elif provider == "ollama":
-            # Attempt to connect to local Ollama instance
-            try:
+
+stats = ProviderStats()
+_cache = None
+_clients = {}
+_clients_lock = threading.Lock()
+# Shared worker threads for blocking SDK calls. Unlike asyncio.to_thread, a
+# timed-out call left running here does not hold up asyncio.run() on exit.
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm")
+# Gemini model names: the one that last worked is tried first, missing ones are skipped
+_gemini_working = None
+_gemini_missing = set()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = DiagnosisCache()
+    return _cache
+
+
+def get_client(provider, api_key):
+    """One SDK client per (provider, key), created lazily and reused across calls."""
+    with _clients_lock:
+        client = _clients.get((provider, api_key))
+        if client is None:
+            timeout = PROVIDER_TIMEOUTS.get(provider)
+            if provider == "groq":
+                from groq import Groq
+                client = Groq(api_key=api_key, timeout=timeout, max_retries=1)
+            elif provider == "openai":
+                from openai import OpenAI
+                client = OpenAI(api_key=api_key, timeout=timeout, max_retries=1)
+            elif provider == "gemini":
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                client = genai
+            elif provider == "ollama":
                 import ollama
-                response = ollama.chat(
-                    model='llama3.2:latest', # requested by user
-                    messages=[
-                        {'role': 'system', 'content': 'You are a concise technical diagnostic assistant for industrial anomaly detection systems.'},
-                        {'role': 'user', 'content': prompt}
-                    ]
-                )
-                return response['message']['content']
-            except ImportError:
-                return "⚠️ **Ollama library not installed.** Run `pip install ollama` locally."
-            except Exception as e:
-                return f"⚠️ **Ollama Connection Error**: {str(e)}. Ensure Ollama is running locally and the `llama3.2:latest` model is downloaded (`ollama pull llama3.2`)."
-
-        else:
-            return f"❌ **Unknown Provider**: {provider}"
+                client = ollama.Client(timeout=timeout)
+            else:
+                client = None
+            _clients[(provider, api_key)] = client
+        return client
+
+
+def _stub_completion(prompt):
+    """Offline provider: deterministic canned answer derived from the prompt."""
+    # Other "- FIELD: ..." lines (e.g. top contributing signals) may sit between these
+    events = re.findall(
+        r"CLASSIFICATION: (.+)\n- RECONSTRUCTION ERROR: (.+)\n(?:- .*\n)*?- DURATION: (.+) min", prompt
+    )
+    answers = [
+        f"**Root Cause**: stub diagnosis for a {severity} event (score {score}, {duration} min).\n"
+        "**Reasoning**: generated offline by the stub provider.\n"
+        "**Recommended Actions**: none."
+        for severity, score, duration in events
+    ]
+    if len(answers) > 1:
+        return "\n".join(f"### Event {i + 1}\n{a}" for i, a in enumerate(answers))
+    return answers[0] if answers else "stub response"
+
+
+def _timed(provider, model, call):
+    started = time.perf_counter()
+    try:
+        result = call()
+    except Exception as e:
+        stats.record(provider, model, time.perf_counter() - started, error=e)
+        raise
+    stats.record(provider, model, time.perf_counter() - started)
+    return result
+
+
+def _gemini_complete(genai, prompt):
+    global _gemini_working
+    candidates = [m for m in GEMINI_MODELS if m not in _gemini_missing]
+    if _gemini_working in candidates:
+        candidates.remove(_gemini_working)
+        candidates.insert(0, _gemini_working)
+
+    last_error = None
+    for model_name in candidates:
+        try:
+            # The SDK usually handles both 'model-name' and 'models/model-name'
+            model = genai.GenerativeModel(model_name)
+            response = _timed("gemini", model_name, lambda: model.generate_content(
+                prompt, request_options={"timeout": PROVIDER_TIMEOUTS["gemini"]}
+            ))
+            _gemini_working = model_name
+            return response.text
+        except Exception as e:
+            last_error = e
+            error_msg = str(e).lower()
+            if "404" in error_msg or "not found" in error_msg or "not supported" in error_msg:
+                _gemini_missing.add(model_name)
+                continue
+            break
+
+    raise last_error if last_error else Exception("Gemini models unavailable.")
+
+
+def _complete(provider, api_key, prompt):
+    """Blocking provider call; raises on failure so errors are never cached."""
+    if provider == "stub":
+        return _stub_completion(prompt)
+
+    client = get_client(provider, api_key)
+
+    if provider in ("groq", "openai"):
+        messages = [{"role": "user", "content": prompt}]
+        if provider == "groq":
+            messages.insert(0, {"role": "system", "content": SYSTEM_PROMPT})
+        response = _timed(provider, PROVIDER_MODELS[provider], lambda: client.chat.completions.create(
+            model=PROVIDER_MODELS[provider],
+            messages=messages,
+            max_tokens=300
+        ))
+        return response.choices[0].message.content
+
+    if provider == "gemini":
+        return _gemini_complete(client, prompt)
 
+    if provider == "ollama":
+        response = _timed(provider, PROVIDER_MODELS[provider], lambda: client.chat(
+            model=PROVIDER_MODELS[provider],
+            messages=[
+                {'role': 'system', 'content': SYSTEM_PROMPT},
+                {'role': 'user', 'content': prompt}
+            ]
+        ))
+        return response['message']['content']
+
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+def _format_error(provider, e):
+    if provider == "ollama":
+        if isinstance(e, ImportError):
+            return "⚠️ **Ollama library not installed.** Run `pip install ollama` locally."
+        return f"⚠️ **Ollama Connection Error**: {str(e)}. Ensure Ollama is running locally and the `llama3.2:latest` model is downloaded (`ollama pull llama3.2`)."
+    if isinstance(e, ValueError) and provider not in PROVIDER_MODELS:
+        return f"❌ **Unknown Provider**: {provider}"
+    return f"❌ **AI Service Error ({provider})**: {str(e)}"
+
+
+def _cached_complete(provider, api_key, prompt, use_cache=True):
+    cache = get_cache() if use_cache else None
+    key = DiagnosisCache.key(provider, PROVIDER_MODELS.get(provider), prompt)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    response = _complete(provider, api_key, prompt)
+    if cache is not None:
+        cache.put(key, response)
+    return response
+
+
+def get_ai_diagnosis(api_key, context, provider="groq", use_cache=True):
+    """
+    Hybrid diagnostic service supporting Groq, Gemini, OpenAI, and local Ollama
+    (plus an offline "stub" provider). Responses are cached persistently.
+    """
+    try:
+        return _cached_complete(provider, api_key, build_prompt(context), use_cache)
     except Exception as e:
-        return f"❌ **AI Service Error ({provider})**: {str(e)}"
+        return _format_error(provider, e)
+
+
+async def _attempt(provider, api_key, prompt, use_cache):
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(
+        loop.run_in_executor(_executor, _cached_complete, provider, api_key, prompt, use_cache),
+        timeout=PROVIDER_TIMEOUTS.get(provider, 15),
+    )
+
+
+async def route_completion(routes, prompt, use_cache=True, hedge_after=HEDGE_AFTER_SECONDS,
+                           budget=DIAGNOSIS_BUDGET_SECONDS):
+    """
+    First successful answer from `routes` [(provider, api_key), ...] in order.
+    Each attempt has its provider deadline; when the current attempt fails or
+    has not answered after `hedge_after` seconds, the next route is started in
+    parallel (hedged request). Raises RouterError when every route failed or
+    `budget` ran out.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget
+    remaining = list(routes)
+    pending = {}
+    errors = []
+
+    def launch():
+        provider, api_key = remaining.pop(0)
+        pending[asyncio.create_task(_attempt(provider, api_key, prompt, use_cache))] = provider
+
+    launch()
+    try:
+        while pending:
+            left = deadline - loop.time()
+            if left <= 0:
+                errors.append(f"budget of {budget:.3g}s exhausted")
+                break
+            done, _ = await asyncio.wait(
+                pending, timeout=min(hedge_after, left) if remaining else left,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                provider = pending.pop(task)
+                if task.exception() is None:
+                    return task.result()
+                errors.append(f"{provider}: {task.exception()!r}")
+            # Slow or failed: bring in the next provider
+            if remaining:
+                launch()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    raise RouterError("; ".join(errors))
+
+
+def _fallback_text(context, error):
+    return (
+        "⚠️ **AI providers unavailable** — showing the rule-based assessment instead.\n\n"
+        f"**Final Assessment**: {rule_based_assessment(context)}\n\n"
+        f"<sub>{error}</sub>"
+    )
+
+
+async def diagnose_events(api_key, contexts, provider="groq", max_concurrency=MAX_CONCURRENCY,
+                          batch_size=1, use_cache=True, fallbacks=(),
+                          hedge_after=HEDGE_AFTER_SECONDS, budget=DIAGNOSIS_BUDGET_SECONDS):
+    """
+    Diagnose many events concurrently (at most `max_concurrency` prompts in
+    flight). With `batch_size` > 1, that many events share one prompt.
+    `fallbacks` are extra (provider, api_key) routes used for failover and
+    hedging. `budget` bounds the whole call, including time spent queued
+    behind other prompts: events not answered within it get the rule-based
+    assessment. Returns one diagnosis string per context, in order.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget
+    semaphore = asyncio.Semaphore(max_concurrency)
+    routes = [(provider, api_key)] + list(fallbacks)
+    batches = [contexts[i:i + batch_size] for i in range(0, len(contexts), batch_size)]
+
+    async def run(batch):
+        prompt = build_prompt(batch[0]) if len(batch) == 1 else build_batch_prompt(batch)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), deadline - loop.time())
+        except asyncio.TimeoutError:
+            error = RouterError(f"budget of {budget}s exhausted before the request was sent")
+            return [_fallback_text(c, error) for c in batch]
+        try:
+            text = await route_completion(routes, prompt, use_cache, hedge_after, deadline - loop.time())
+        except RouterError as e:
+            return [_fallback_text(c, e) for c in batch]
+        finally:
+            semaphore.release()
+        return [text] if len(batch) == 1 else split_batch_response(text, len(batch))
+
+    results = await asyncio.gather(*(run(batch) for batch in batches))
+    return [answer for answers in results for answer in answers]
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+# Logs within this many minutes before an event starts / after it ends are related
+LOG_PADDING_MINUTES = 5
+
+
+class LogIndex:
+    """
+    Operator logs sorted by timestamp once, so the logs related to any number
+    of events come from two vectorized searchsorted calls instead of a full
+    scan (and timestamp re-parse) per event.
+    """
+
+    def __init__(self, logs):
+        times = pd.to_datetime(logs["timestamp"]).to_numpy(dtype="datetime64[ns]")
+        order = np.argsort(times, kind="stable")
+        # Original columns are kept as-is (the raw timestamp strings go into prompts)
+        self.logs = logs.iloc[order].reset_index(drop=True)
+        self.times = times[order]
+
+    def __len__(self):
+        return len(self.times)
+
+    def bounds(self, starts, ends, padding_minutes=LOG_PADDING_MINUTES):
+        """Row ranges [lo, hi) of logs inside [start - padding, end + padding] for each interval."""
+        pad = np.timedelta64(int(padding_minutes * 60 * 1e9), "ns")
+        starts = np.asarray(starts, dtype="datetime64[ns]")
+        ends = np.asarray(ends, dtype="datetime64[ns]")
+        lo = np.searchsorted(self.times, starts - pad, side="left")
+        hi = np.searchsorted(self.times, ends + pad, side="right")
+        return lo, hi
+
+    def between(self, t0, t1):
+        lo, hi = self.bounds([pd.Timestamp(t0)], [pd.Timestamp(t1)], padding_minutes=0)
+        return self.logs.iloc[lo[0]:hi[0]]
+
+    def related_logs(self, events, padding_minutes=LOG_PADDING_MINUTES):
+        """List of related log records (dicts) per event, in event order."""
+        lo, hi = self.bounds(events.start, events.end, padding_minutes)
+        return [self.logs.iloc[a:b].to_dict("records") for a, b in zip(lo, hi)]
+
+
+def correlate_logs(events, logs, padding_minutes=LOG_PADDING_MINUTES):
+    """One-shot helper: related log records for every event in an EventTable."""
+    return LogIndex(logs).related_logs(events, padding_minutes)
@@ -0,0 +1,195 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from event_builder import deviation_reference, signal_concentration, top_contributors
+from feature_matrix import parse_column
+from preprocessing import STATS, WINDOW_MINUTES
+from structure_model import CALIBRATION, fit_structure_spot, structure_scores
+
+
+def _event_duration(start, end):
+    # Calculate duration in minutes (same rule as event_builder)
+    return max(1, int((end - start).total_seconds() / 60))
+
+
+class StreamingDetector:
+    """
+    Stateful counterpart of build_windows -> detect_behavior_anomalies ->
+    detect_structure_anomalies -> build_events for live feeds.
+
+    Raw (signal_id, timestamp, value) records are folded into the open window
+    with O(1) running moments. When a record lands in a later window the open
+    one is closed, scored with the pre-trained behavior model and the
+    incremental structure score, and used to extend or close the current
+    event. Both scores are thresholded by streaming POT models (the behavior
+    one from the model artifact, `structure_spot` fitted on history), each
+    updated in O(1) per window. Events keep running per-signal error and
+    deviation sums for their top contributing signals and concentration;
+    deviations are measured from the model's training means and scales, or
+    from the history's median and MAD when built with `from_windows` (as
+    build_events does over a batch). Records should arrive in time order;
+    a late sample whose window has already been closed is dropped and
+    counted in `late_samples` (the open window never moves backwards).
+    State is bounded by the number of signals, the structure window and
+    `history` recent windows.
+    """
+
+    def __init__(self, model, structure_spot, window_minutes=WINDOW_MINUTES,
+                 structure_window=5, history=1000):
+        self.model = model
+        self.behavior_spot = model.threshold_model()
+        self.structure_spot = structure_spot
+        self.window_ns = pd.Timedelta(minutes=window_minutes).value
+        self.structure_window = structure_window
+
+        self.column_index = {c: i for i, c in enumerate(model.columns)}
+        self.mean_columns = [i for i, c in enumerate(model.columns) if parse_column(c)[1] == "mean"]
+        # Signals not seen yet fall back to the training mean (neutral for the scaler)
+        self.features = np.array(model.mean, dtype=np.float64)
+        # Reference for per-signal deviation (concentration); from_windows replaces it
+        self.deviation_center = self.features[self.mean_columns].copy()
+        self.deviation_scale = np.where(model.scale[self.mean_columns] > 0, model.scale[self.mean_columns], 1.0)
+
+        self.current_window = None
+        self.moments = {}
+        self.late_samples = 0
+        self.recent_means = deque(maxlen=structure_window + 1)
+        self.current_event = None
+        self.windows = deque(maxlen=history)
+
+    @classmethod
+    def from_windows(cls, model, windows, calibration=CALIBRATION, **kwargs):
+        """
+        Prime the detector from a batch of historical windows: the structure
+        SPOT is calibrated on the leading `calibration` fraction of their
+        structure scores (the same slice a batch run calibrates on), signal
+        deviation is measured from their median and MAD, and the structure
+        history is seeded with the most recent windows. Replaying `windows`
+        through the detector afterwards is close to, not identical with, a
+        batch run: the replay also feeds the calibration windows through both
+        SPOT updates, which a batch run only flags.
+        """
+        structure_window = kwargs.get("structure_window", 5)
+        if len(windows) <= structure_window:
+            raise ValueError(f"Priming needs more than structure_window={structure_window} windows, got {len(windows)}")
+        features = model.matrix(windows)
+        means = features.stat("mean").astype(np.float64)
+        scores = structure_scores(means, structure_window)
+        spot, _ = fit_structure_spot(scores, structure_window, calibration)
+        detector = cls(model, spot, **kwargs)
+
+        detector.features[:] = features.values[-1]
+        detector.deviation_center, detector.deviation_scale = deviation_reference(means)
+        detector.recent_means.extend(means[-(detector.structure_window + 1):])
+        return detector
+
+    def update(self, signal_id, timestamp, value):
+        """
+        Add one raw sample; returns the events closed as a result (usually
+        none) as dicts with the EventTable fields (see EventTable.from_dicts).
+        Samples for an already closed window are dropped (see `late_samples`).
+        """
+        # Integer nanoseconds: flooring a Timestamp object per sample is the slow part
+        ns = pd.Timestamp(timestamp).value
+        window = ns - ns % self.window_ns
+
+        closed = []
+        if self.current_window is not None:
+            if window < self.current_window:
+                # Its window was scored already; folding it into the open one would mislabel it
+                self.late_samples += 1
+                return closed
+            if window > self.current_window:
+                closed = self._close_window()
+        self.current_window = window
+
+        # Welford update: count, mean, M2, last
+        m = self.moments.get(signal_id)
+        if m is None:
+            self.moments[signal_id] = [1, value, 0.0, value]
+        else:
+            m[0] += 1
+            delta = value - m[1]
+            m[1] += delta / m[0]
+            m[2] += delta * (value - m[1])
+            m[3] = value
+        return closed
+
+    def update_many(self, records):
+        closed = []
+        for signal_id, timestamp, value in records:
+            closed.extend(self.update(signal_id, timestamp, value))
+        return closed
+
+    def flush(self):
+        """Close the open window and any open event (end of stream)."""
+        closed = self._close_window() if self.current_window is not None else []
+        self.current_window = None
+        if self.current_event is not None:
+            closed.append(self._finish_event())
+        return closed
+
+    def _close_window(self):
+        for signal_id, (count, mean, m2, last) in self.moments.items():
+            # A single sample has no spread
+            stats = {"mean": mean, "std": np.sqrt(m2 / (count - 1)) if count > 1 else 0.0, "last": last}
+            for stat in STATS:
+                i = self.column_index.get(f"{signal_id}_{stat}")
+                if i is not None:
+                    self.features[i] = stats[stat]
+        # Signals missing from this window keep their previous value (forward fill)
+        self.moments = {}
+
+        errors = self.model.feature_errors(self.features[None, :])
+        behavior_score = float(errors.mean())
+
+        means = self.features[self.mean_columns].copy()
+        self.recent_means.append(means)
+        structure_score, structure_anomaly = 0.0, False
+        if len(self.recent_means) > self.structure_window:
+            structure_score = float(structure_scores(np.array(self.recent_means), self.structure_window)[-1])
+            structure_anomaly = self.structure_spot.update(structure_score)
+
+        row = {
+            "window": pd.Timestamp(self.current_window),
+            "behavior_score": behavior_score,
+            "behavior_anomaly": self.behavior_spot.update(behavior_score),
+            "signal_errors": self.model.signal_errors(errors)[0],
+            "deviation": np.abs(means - self.deviation_center) / self.deviation_scale,
+            "structure_score": structure_score,
+            "structure_anomaly": structure_anomaly,
+        }
+        self.windows.append(row)
+        return self._update_event(row)
+
+    def _update_event(self, row):
+        if row["behavior_anomaly"] or row["structure_anomaly"]:
+            if self.current_event is None:
+                self.current_event = {
+                    "start": row["window"], "end": row["window"], "severity": 0.0,
+                    "peak_behavior": 0.0, "peak_structure": 0.0,
+                    "signal_errors": np.zeros(len(self.model.signals), dtype=np.float32),
+                    "deviation": np.zeros(len(self.mean_columns)),
+                }
+            event = self.current_event
+            event["end"] = row["window"]
+            event["severity"] += row["behavior_score"]
+            event["peak_behavior"] = max(event["peak_behavior"], row["behavior_score"])
+            event["peak_structure"] = max(event["peak_structure"], row["structure_score"])
+            event["signal_errors"] += row["signal_errors"]
+            event["deviation"] += row["deviation"]
+            return []
+        if self.current_event is not None:
+            return [self._finish_event()]
+        return []
+
+    def _finish_event(self):
+        event = self.current_event
+        event["duration"] = _event_duration(event["start"], event["end"])
+        event["concentration"] = float(signal_concentration(event.pop("deviation")[None, :])[0])
+        codes, shares = top_contributors(event.pop("signal_errors")[None, :])
+        event["root_causes"] = [(self.model.signals[c], float(s)) for c, s in zip(codes[0], shares[0]) if c >= 0]
+        self.current_event = None
+        return event
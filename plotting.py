@@ -1,19 +1,29 @@
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import plotly.express as px
+from preprocessing import STREAM_DTYPES, load_timeseries
+from downsampling import MAX_POINTS_PER_TRACE, downsample_frame
 
 
-def plot_raw_timeseries(csv_path):
-    """Interactive raw data exploration."""
-    df = pd.read_csv(csv_path)
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
-    
+def _title_suffix(shown, total):
+    return f" · {shown:,} of {total:,} points" if shown < total else ""
+
+
+def plot_raw_timeseries(timeseries, x_range=None, max_points=MAX_POINTS_PER_TRACE):
+    """
+    Interactive raw data exploration. Each signal is LTTB-downsampled to
+    `max_points` and drawn with WebGL; pass `x_range` (t0, t1) to re-query
+    a zoomed-in range at full point budget.
+    """
+    df = load_timeseries(timeseries, dtype=STREAM_DTYPES)
+    points = downsample_frame(df, by="signal_id", x_range=x_range, n_out=max_points)
+
     fig = go.Figure()
-    for signal in df["signal_id"].unique():
-        subset = df[df["signal_id"] == signal]
-        fig.add_trace(go.Scatter(
+    for signal, subset in points.groupby("signal_id", observed=True, sort=False):
+        fig.add_trace(go.Scattergl(
             x=subset["timestamp"],
             y=subset["value"],
             name=signal,
@@ -22,7 +32,7 @@ def plot_raw_timeseries(csv_path):
         ))
 
     fig.update_layout(
-        title="Physical Sensor Exploration (Raw Asynchronous Data)",
+        title="Physical Sensor Exploration (Raw Asynchronous Data)" + _title_suffix(len(points), len(df)),
         xaxis_title="Time",
         yaxis_title="Value",
         template="plotly_white",
@@ -57,14 +67,17 @@ def plot_anomaly_scores(df):
     return fig
 
 
-def plot_events_and_logs(windows, events, timeseries_csv, log_csv):
-    """Interactive Plotly dashboard for anomalies and logs."""
+def plot_events_and_logs(windows, events, timeseries, log_csv, x_range=None, max_points=MAX_POINTS_PER_TRACE):
+    """
+    Interactive Plotly dashboard for anomalies and logs. Score and sensor
+    traces are downsampled to `max_points` each (WebGL); `x_range` (t0, t1)
+    zooms the view and re-queries that range at full point budget.
+    """
     logs = pd.read_csv(log_csv)
     logs["timestamp"] = pd.to_datetime(logs["timestamp"])
     
     # Load raw data for context
-    raw_df = pd.read_csv(timeseries_csv)
-    raw_df["timestamp"] = pd.to_datetime(raw_df["timestamp"])
+    raw_df = load_timeseries(timeseries, dtype=STREAM_DTYPES)
     
     # Create subplots
     fig = make_subplots(
@@ -76,21 +89,22 @@ def plot_events_and_logs(windows, events, timeseries_csv, log_csv):
     )
 
     # 1. Plot Anomaly Scores (Top Axis)
+    behavior = downsample_frame(windows, x="window", y="behavior_score", x_range=x_range, n_out=max_points)
+    structure = downsample_frame(windows, x="window", y="structure_score", x_range=x_range, n_out=max_points)
     fig.add_trace(
-        go.Scatter(x=windows["window"], y=windows["behavior_score"], name="Behavior Score", line=dict(color='blue')),
+        go.Scattergl(x=behavior["window"], y=behavior["behavior_score"], name="Behavior Score", line=dict(color='blue')),
         row=1, col=1
     )
     fig.add_trace(
-        go.Scatter(x=windows["window"], y=windows["structure_score"], name="Structure Score", line=dict(color='green')),
+        go.Scattergl(x=structure["window"], y=structure["structure_score"], name="Structure Score", line=dict(color='green')),
         row=1, col=1
     )
 
     # 2. Plot Raw Sensor Data (Bottom Axis)
-    signals = raw_df["signal_id"].unique()
-    for sig in signals:
-        sig_data = raw_df[raw_df["signal_id"] == sig]
+    raw_points = downsample_frame(raw_df, by="signal_id", x_range=x_range, n_out=max_points)
+    for sig, sig_data in raw_points.groupby("signal_id", observed=True, sort=False):
         fig.add_trace(
-            go.Scatter(
+            go.Scattergl(
                 x=sig_data["timestamp"], 
                 y=sig_data["value"], 
                 name=f"Sensor: {sig}",
@@ -102,69 +116,76 @@ def plot_events_and_logs(windows, events, timeseries_csv, log_csv):
             row=2, col=1
         )
 
-    # 3. Add Event Regions (Shaded Spans)
-    legend_added = set()
-    for i, event in enumerate(events):
-        start = pd.to_datetime(event["start"])
-        end = pd.to_datetime(event["end"])
-        cluster = event.get('cluster', 0)
+    # 3. Event regions and operator log lines, built in bulk: one shapes list,
+    # one star trace and one hover trace instead of a shape/trace per item
+    panels = [("x", "y domain"), ("x2", "y2 domain")]
+    score_max = windows["behavior_score"].max()
+    shapes, annotations = [], []
+
+    starts, ends, clusters = events.start, events.end, events.cluster
+    for i, (start, end, cluster) in enumerate(zip(starts, ends, clusters)):
         color = 'LightCoral' if cluster == 1 else 'navajowhite'
-        label = "High Severity Event" if cluster == 1 else "Standard Anomaly"
-        
-        # Add highlight
-        fig.add_vrect(
-            x0=start, x1=end,
-            fillcolor=color, opacity=0.3,
-            layer="below", line_width=0,
-            annotation_text=f" Event {i}", 
-            annotation_position="top left",
-            row="all", col=1
-        )
-        
-        # Add midpoint marker star
-        midpoint = start + (end - start) / 2
+        for xref, yref in panels:
+            shapes.append(dict(
+                type="rect", xref=xref, yref=yref, x0=start, x1=end, y0=0, y1=1,
+                fillcolor=color, opacity=0.3, layer="below", line_width=0,
+            ))
+            annotations.append(dict(
+                text=f" Event {i}", showarrow=False, xref=xref, yref=yref,
+                x=start, y=1, xanchor="left", yanchor="top",
+            ))
+
+    if len(events):
+        # Midpoint marker stars
+        midpoints = starts + (ends - starts) / 2
+        labels = np.where(clusters == 1, "High Severity Event", "Standard Anomaly")
         fig.add_trace(
             go.Scatter(
-                x=[midpoint], 
-                y=[windows["behavior_score"].max() * 1.05],
+                x=midpoints,
+                y=np.full(len(events), score_max * 1.05),
                 mode="markers",
                 marker=dict(color="red", size=15, symbol="star"),
                 name="Event Peak (Legend Marker)",
-                hovertext=f"Event {i} Center<br>Type: {label}",
-                showlegend=True if "peak" not in legend_added else False
+                hovertext=[f"Event {i} Center<br>Type: {label}" for i, label in enumerate(labels)],
             ),
             row=1, col=1
         )
-        legend_added.add("peak")
-
-    # 4. Add Operator Logs (Interactive Lines)
-    for i, (_, row) in enumerate(logs.iterrows()):
-        log_ts = pd.to_datetime(row["timestamp"])
-        log_text = row["log"]
-        
-        fig.add_vline(
-            x=log_ts,
-            line_dash="dash",
-            line_color="red",
-            opacity=0.5,
-            row="all", col=1
-        )
-        
-        # Invisible trace for hover tooltip
+
+    # 4. Operator logs: dashed lines on both panels, hover text on the top one
+    log_times = logs["timestamp"].to_numpy(dtype="datetime64[ns]")
+    for log_ts in log_times:
+        for xref, yref in panels:
+            shapes.append(dict(
+                type="line", xref=xref, yref=yref, x0=log_ts, x1=log_ts, y0=0, y1=1,
+                line=dict(color="red", dash="dash"), opacity=0.5,
+            ))
+
+    if len(logs):
+        # Invisible vertical segments joined by None gaps carry the hover tooltips
+        n = len(logs)
+        x = np.empty(3 * n, dtype=object)
+        x[0::3] = x[1::3] = pd.DatetimeIndex(log_times)
+        y = np.tile([0.0, score_max * 1.2, np.nan], n)
+        texts = (f"<b>Operator Log:</b><br>{text}" for text in logs["log"])
+        hovertext = [t for text in texts for t in (text, text, "")]
         fig.add_trace(
             go.Scatter(
-                x=[log_ts, log_ts],
-                y=[0, windows["behavior_score"].max() * 1.2],
+                x=x,
+                y=y,
                 mode="lines",
                 line=dict(width=0),
                 name="Operator Chat Log",
                 hoverinfo="text",
-                hovertext=f"<b>Operator Log:</b><br>{log_text}",
-                showlegend=True if i == 0 else False
+                hovertext=hovertext,
             ),
             row=1, col=1
         )
 
+    fig.update_layout(
+        shapes=shapes,
+        annotations=list(fig.layout.annotations) + annotations,
+    )
+
     # Layout Polish
     fig.update_layout(
         height=850,
@@ -174,16 +195,11 @@ def plot_events_and_logs(windows, events, timeseries_csv, log_csv):
         legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
         xaxis2_rangeslider_visible=True,
     )
+    if x_range is not None:
+        fig.update_xaxes(range=[pd.Timestamp(x_range[0]), pd.Timestamp(x_range[1])])
 
     fig.update_yaxes(title_text="Anomaly Score", row=1, col=1)
     fig.update_yaxes(title_text="Sensor Value", row=2, col=1)
 
-    # Save outputs (local/CLI only — skipped silently on Streamlit Cloud)
-    try:
-        fig.write_html("anomaly_dashboard.html")
-        fig.write_image("anomaly_events_plot.png")
-        print("[Plotting] Static outputs saved: anomaly_dashboard.html, anomaly_events_plot.png")
-    except Exception:
-        pass  # Cloud environment — file writes and Kaleido not available
-
+    # Static HTML/PNG copies are opt-in via figure_export.export_dashboard
     return fig
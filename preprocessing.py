@@ -1,25 +1,350 @@
+import numpy as np
 import pandas as pd
 
+from timeseries_cache import load_cached
+
+# Default window size; every entry point accepts its own `window_minutes`.
 WINDOW_MINUTES = 1
 
-def build_windows(csv_path):
-    df = pd.read_csv(csv_path)
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
+STATS = ("mean", "std", "last")
+# Per-signal reconstruction error columns added by detect_behavior_anomalies
+ERROR_SUFFIX = "_error"
+
+# Explicit dtypes for streaming ingestion: categorical ids and float32 values
+# keep each chunk compact, and an explicit format skips per-row format inference.
+STREAM_DTYPES = {"signal_id": "category", "value": "float32"}
+TIMESTAMP_FORMAT = "ISO8601"
+CHUNK_ROWS = 1_000_000
+
+# Window alignments for build_windows: "floor" buckets raw samples by their
+# timestamp, "time" resamples the sample-and-hold signal (see resample)
+ALIGNMENTS = ("floor", "time")
+# Output grids of resample by default
+RESOLUTIONS = ("1s", "1min", "15min")
+# Without an explicit tolerance a sample stays valid for this many of its signal's median sampling intervals
+TOLERANCE_FACTOR = 3
+
+
+def load_timeseries(source, dtype=None):
+    """
+    Long-format (signal_id, timestamp, value) frame from a CSV path, an Arrow
+    cache entry (see timeseries_cache) or an already loaded DataFrame.
+    """
+    if isinstance(source, pd.DataFrame):
+        return source
+    if str(source).endswith(".arrow"):
+        return load_cached(source)
+
+    df = pd.read_csv(source, dtype=dtype)
+    df["timestamp"] = parse_timestamps(df["timestamp"])
+    return df
+
+
+def parse_timestamps(values):
+    """ISO 8601 fast path; any other layout pandas understands falls back to format inference."""
+    try:
+        return pd.to_datetime(values, format=TIMESTAMP_FORMAT)
+    except ValueError:
+        return pd.to_datetime(values)
+
+
+def fill_gaps(wide, limit=None):
+    """
+    Model-ready imputation of a wide window frame: forward fill (at most
+    `limit` windows), then any value still missing past the limit gets the
+    mean of the signal's samples up to that window (an expanding mean).
+    Windows before a signal's first sample have nothing earlier to draw on
+    and get 0. Nothing is back-filled and no mean looks ahead, so no window
+    sees a later sample. Feature columns come back as float32.
+    """
+    features = wide.columns.drop("window")
+    # Features are stored as one row-major float32 block, filled in place; the
+    # returned frame wraps it, so feature_matrix.FeatureMatrix views it as is
+    values = np.ascontiguousarray(wide[features].to_numpy(), dtype=np.float32)
+    if not values.flags.writeable:
+        values = values.copy()
+    missing = np.isnan(values)
+    if missing.any():
+        rows = np.arange(len(values), dtype=np.int32)[:, None]
+        # Row of the latest observed value at or above each cell (-1: none yet)
+        source = np.where(missing, np.int32(-1), rows)
+        np.maximum.accumulate(source, axis=0, out=source)
+        fill = missing & (source >= 0)
+        if limit is not None:
+            fill &= rows - source <= limit
+
+        # Past the limit: expanding mean of the observed values so far, taken
+        # before forward filling so filled cells do not count as samples
+        r, c = np.nonzero(missing & ~fill)
+        means = np.zeros(len(r), dtype=np.float32)
+        if len(r):
+            columns, c_local = np.unique(c, return_inverse=True)
+            observed = ~missing[:, columns]
+            sums = np.cumsum(np.where(observed, values[:, columns], 0.0), axis=0, dtype=np.float64)
+            counts = np.cumsum(observed, axis=0, dtype=np.int32)
+            seen = counts[r, c_local] > 0
+            means[seen] = sums[r, c_local][seen] / counts[r, c_local][seen]
+
+        fr, fc = np.nonzero(fill)
+        values[fr, fc] = values[source[fr, fc], fc]
+        values[r, c] = means
+
+    filled = pd.DataFrame(values, columns=features, index=wide.index, copy=False)
+    filled.insert(0, "window", wide["window"])
+    return filled
+
+
+def _pivot_windows(stats, signals, limit=None):
+    """Long (window, signal_id) stats -> wide {signal}_mean/_std/_last frame."""
+    wide = stats[list(STATS)].unstack("signal_id")
+    columns = [(stat, signal) for signal in signals for stat in STATS]
+    wide = wide.reindex(columns=pd.MultiIndex.from_tuples(columns))
+    wide.columns = [f"{signal}_{stat}" for stat, signal in columns]
+    wide = wide.reset_index()
+    return fill_gaps(wide, limit)
+
+
+def aggregate_windows(df, window_minutes=WINDOW_MINUTES, limit=None):
+    """
+    Vectorized windowing engine: a single groupby over (window, signal_id)
+    followed by a pivot to the wide {signal}_mean/_std/_last layout.
+    Windows without samples are forward-filled for at most `limit` windows.
+    """
+    df = df.assign(window=df["timestamp"].dt.floor(f"{window_minutes}min"))
+    # Stable sort keeps the raw row order inside each window, so "last" and the
+    # column order (first appearance of each signal) match the per-window loop.
+    df = df.sort_values("window", kind="stable")
+    signals = list(df["signal_id"].unique())
+
+    keys = ["window", "signal_id"]
+    stats = df.groupby(keys, sort=True, observed=True)["value"].agg(["mean", "std", "size"])
+    # A single sample has no spread
+    stats["std"] = stats["std"].where(stats["size"] > 1, 0.0)
+    stats["last"] = df.drop_duplicates(keys, keep="last").set_index(keys)["value"]
+
+    return _pivot_windows(stats, signals, limit)
+
+
+def _tolerances(t, starts, ends, signals, tolerance):
+    """Per-signal sample validity in ns: `tolerance` is None (auto), a scalar, or a {signal: value} dict."""
+    if not isinstance(tolerance, dict):
+        tolerance = {signal: tolerance for signal in signals}
+    tol = np.empty(len(signals), dtype=np.int64)
+    for g, (signal, lo, hi) in enumerate(zip(signals, starts, ends)):
+        value = tolerance.get(signal)
+        if value is not None:
+            tol[g] = pd.Timedelta(value).value
+        elif hi - lo > 1:
+            tol[g] = TOLERANCE_FACTOR * int(np.median(np.diff(t[lo:hi])))
+        else:
+            tol[g] = np.iinfo(np.int64).max // 4
+    return np.maximum(tol, 1)
+
+
+def resample(df, resolutions=RESOLUTIONS, tolerance=None, max_gap=None, stats=STATS):
+    """
+    Resample irregular long-format (signal_id, timestamp, value) data onto
+    regular grids, one wide {signal}_{stat} frame per resolution:
+    {"1min": frame, ...}, each with a "window" column of bin starts.
+
+    Each sample holds its value until the next sample of its signal, but for
+    at most `tolerance` (per signal: a scalar, a {signal: tolerance} dict, or
+    None for TOLERANCE_FACTOR x the signal's median interval). "mean" and
+    "std" are time-weighted over the covered part of each bin; "last" is the
+    value in effect at the bin's end (a backward as-of join within the
+    tolerance). Bins with no coverage are forward-filled for at most
+    `max_gap`, else NaN.
+
+    The data is sorted once by (signal, time); per signal, prefix integrals
+    of the held value are built once and every resolution is read off them
+    with one binary search per bin edge, so adding resolutions costs
+    O(bins log samples), not another pass over the samples.
+    """
+    codes, signals = pd.factorize(df["signal_id"])
+    times = df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    values = df["value"].to_numpy(dtype=np.float64)
+    valid = (codes >= 0) & ~np.isnan(values)
+    order = np.flatnonzero(valid)[np.lexsort((times[valid], codes[valid]))]
+    codes, times, values = codes[order], times[order], values[order]
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    ends = np.append(starts[1:], len(codes))
+    signals = [str(signals[c]) for c in codes[starts]]
+    tol = _tolerances(times, starts, ends, signals, tolerance)
+
+    grids = {}
+    for res in resolutions:
+        step = pd.Timedelta(res).value
+        first = times.min() - times.min() % step if len(times) else 0
+        grids[res] = first + step * np.arange((times.max() - first) // step + 2 if len(times) else 1)
+    columns = {res: {} for res in resolutions}
+
+    for g, (signal, lo, hi) in enumerate(zip(signals, starts, ends)):
+        t, v = times[lo:hi], values[lo:hi]
+        # Seconds each sample's value stays in effect
+        hold = np.minimum(np.diff(t, append=t[-1] + tol[g]), tol[g]) / 1e9
+        # Centering keeps the prefix sums small; it is added back to the mean
+        center = v.mean()
+        x = v - center
+        cum_w = np.concatenate(([0.0], np.cumsum(hold)[:-1]))
+        cum_x = np.concatenate(([0.0], np.cumsum(x * hold)[:-1]))
+        cum_xx = np.concatenate(([0.0], np.cumsum(x * x * hold)[:-1]))
+
+        for res, edges in grids.items():
+            # Integrals of the held signal up to every bin edge
+            k = np.searchsorted(t, edges, side="right") - 1
+            seen = k >= 0
+            k = np.maximum(k, 0)
+            part = np.where(seen, np.minimum((edges - t[k]) / 1e9, hold[k]), 0.0)
+            w = np.diff(np.where(seen, cum_w[k] + part, 0.0))
+            sx = np.diff(np.where(seen, cum_x[k] + x[k] * part, 0.0))
+            sxx = np.diff(np.where(seen, cum_xx[k] + x[k] * x[k] * part, 0.0))
+            covered = w > 0
+            safe_w = np.where(covered, w, 1.0)
+            mean_x = np.where(covered, sx / safe_w, np.nan)
+
+            out = columns[res]
+            if "mean" in stats:
+                out[f"{signal}_mean"] = mean_x + center
+            if "std" in stats:
+                out[f"{signal}_std"] = np.sqrt(np.maximum(sxx / safe_w - mean_x ** 2, 0.0))
+            if "last" in stats:
+                j = np.searchsorted(t, edges[1:], side="left") - 1
+                fresh = (j >= 0) & (edges[1:] - t[np.maximum(j, 0)] <= tol[g])
+                out[f"{signal}_last"] = np.where(fresh, v[np.maximum(j, 0)], np.nan)
+
+    frames = {}
+    for res, edges in grids.items():
+        frame = pd.DataFrame(columns[res], index=pd.RangeIndex(len(edges) - 1))
+        frame = frame[[f"{signal}_{stat}" for signal in signals for stat in stats]]
+        limit = 0 if max_gap is None else int(pd.Timedelta(max_gap) // pd.Timedelta(res))
+        if limit:
+            frame = frame.ffill(limit=limit)
+        frame.insert(0, "window", pd.to_datetime(edges[:-1]))
+        frames[res] = frame
+    return frames
+
+
+def _chunk_moments(chunk, window_minutes):
+    """Mergeable per-(window, signal) moments for one chunk of raw rows."""
+    chunk = chunk.assign(window=chunk["timestamp"].dt.floor(f"{window_minutes}min"))
+    chunk = chunk.sort_values("window", kind="stable")
+    keys = ["window", "signal_id"]
+
+    values = chunk["value"].astype("float64")
+    grouped = values.groupby([chunk["window"], chunk["signal_id"]], sort=True, observed=True)
+    moments = grouped.agg(["size", "count", "mean"])
+    # Reader chunks keep a global row index; it records first appearance order
+    rows = pd.Series(chunk.index, index=chunk.index)
+    moments["first"] = rows.groupby([chunk["window"], chunk["signal_id"]], sort=True, observed=True).min()
+    moments["m2"] = grouped.var(ddof=0).fillna(0.0) * moments["count"]
+    moments["last"] = chunk.drop_duplicates(keys, keep="last").set_index(keys)["value"].astype("float64")
+
+    # Plain string ids so partial state from different chunks aligns
+    moments.index = moments.index.set_levels(
+        moments.index.levels[1].astype(str), level="signal_id"
+    )
+    return moments, chunk["window"].max()
+
+
+def _merge_moments(carry, moments):
+    """Combine partial window moments (Chan et al. parallel variance update)."""
+    if carry is None or carry.empty:
+        return moments
+
+    both = carry.index.intersection(moments.index)
+    if len(both) == 0:
+        return pd.concat([carry, moments]).sort_index()
+
+    a = carry.loc[both]
+    b = moments.loc[both]
+    n = a["count"] + b["count"]
+    delta = b["mean"] - a["mean"]
+    safe_n = n.where(n > 0, 1)
+
+    merged = pd.DataFrame({
+        "size": a["size"] + b["size"],
+        "count": n,
+        "mean": np.where(n > 0, a["mean"].fillna(0) + delta.fillna(0) * b["count"] / safe_n, np.nan),
+        "m2": a["m2"] + b["m2"] + delta.fillna(0) ** 2 * a["count"] * b["count"] / safe_n,
+        "last": b["last"],
+        "first": np.minimum(a["first"], b["first"]),
+    }, index=both)
+
+    rest = [carry.drop(both), moments.drop(both), merged]
+    return pd.concat(rest).sort_index()
+
+
+def _finish_moments(moments):
+    stats = moments[["mean", "size", "first"]].copy()
+    std = np.sqrt(moments["m2"] / (moments["count"] - 1).where(moments["count"] > 1))
+    # A single sample has no spread
+    stats["std"] = std.where(moments["size"] > 1, 0.0)
+    stats["last"] = moments["last"]
+    return stats
+
+
+def iter_window_stats(csv_path, window_minutes=WINDOW_MINUTES, chunksize=CHUNK_ROWS):
+    """
+    Stream a time-ordered long-format CSV in chunks and yield long-format
+    (window, signal_id) -> mean/std/last frames as soon as windows close.
+
+    Only the windows still open at a chunk boundary are carried over, so memory
+    is bounded by the chunk size plus the number of open windows x signals.
+    """
+    carry = None
+    reader = pd.read_csv(csv_path, dtype=STREAM_DTYPES, chunksize=chunksize)
+    for chunk in reader:
+        chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], format=TIMESTAMP_FORMAT)
+        moments, newest = _chunk_moments(chunk, window_minutes)
+        carry = _merge_moments(carry, moments)
+
+        # The newest window may continue in the next chunk; everything older is final
+        done = carry.index.get_level_values("window") < newest
+        if done.any():
+            yield _finish_moments(carry[done])
+            carry = carry[~done]
+
+    if carry is not None and not carry.empty:
+        yield _finish_moments(carry)
+
 
-    df["window"] = df["timestamp"].dt.floor(f"{WINDOW_MINUTES}min")
+def stream_windows(csv_path, window_minutes=WINDOW_MINUTES, chunksize=CHUNK_ROWS, limit=None):
+    """Chunked counterpart of build_windows for files larger than memory."""
+    parts = list(iter_window_stats(csv_path, window_minutes, chunksize))
+    if not parts:
+        return pd.DataFrame(columns=["window"])
 
-    windows = []
+    stats = pd.concat(parts)
+    # Column order follows first appearance, as in the in-memory engine
+    order = stats.reset_index().sort_values(["window", "first"])
+    return _pivot_windows(stats, list(order["signal_id"].unique()), limit)
 
-    for window, group in df.groupby("window"):
-        row = {"window": window}
 
-        for signal in group["signal_id"].unique():
-            vals = group[group["signal_id"] == signal]["value"]
-            row[f"{signal}_mean"] = vals.mean()
-            row[f"{signal}_std"] = vals.std() if len(vals) > 1 else 0
-            row[f"{signal}_last"] = vals.iloc[-1]
+def build_windows(source, window_minutes=WINDOW_MINUTES, chunksize=None, alignment="floor",
+                  tolerance=None, max_gap=None):
+    """
+    Aggregate long-format (signal_id, timestamp, value) data into per-window
+    features. `source` is anything load_timeseries accepts; pass `chunksize`
+    to stream a CSV instead of loading it whole.
 
-        windows.append(row)
+    `alignment="time"` uses the time-weighted resampler (see resample, with
+    its per-signal `tolerance`) instead of per-window sample statistics.
+    Either way, windows missing a signal are forward-filled for at most
+    `max_gap` (a Timedelta or string, default unlimited).
+    """
+    if alignment not in ALIGNMENTS:
+        raise ValueError(f"Unknown alignment {alignment!r}; expected one of {ALIGNMENTS}")
+    limit = None
+    if max_gap is not None:
+        # A gap shorter than one window allows no forward fill at all
+        limit = int(pd.Timedelta(max_gap) // pd.Timedelta(minutes=window_minutes))
 
-    # Use forward fill then backward fill to handle asynchronous data more robustly than fillna(0)
-    return pd.DataFrame(windows).ffill().bfill().fillna(0)
\ No newline at end of file
+    if alignment == "time":
+        if chunksize:
+            raise ValueError("alignment='time' needs the whole series; use chunksize only with 'floor'")
+        res = f"{window_minutes}min"
+        windows = resample(load_timeseries(source), (res,), tolerance=tolerance)[res]
+        return fill_gaps(windows, limit)
+    if chunksize:
+        return stream_windows(source, window_minutes, chunksize, limit)
+    return aggregate_windows(load_timeseries(source), window_minutes, limit)
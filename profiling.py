@@ -0,0 +1,145 @@
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, RSS is reported as None
+    resource = None
+
+# Optional per-stage dumps: a directory plus "cprofile" (.prof) or "pyinstrument" (.html)
+DUMP_DIR = os.environ.get("PIPELINE_PROFILE_DIR")
+DUMP_FORMAT = os.environ.get("PIPELINE_PROFILER", "cprofile")
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _rows(obj):
+    if obj is None or isinstance(obj, int):
+        return obj
+    if isinstance(obj, (str, bytes)):  # file paths
+        return None
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+class _NullStage:
+    """Shared stand-in when profiling is off: attribute writes are ignored."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+    """One timed pipeline stage. Set `rows_out` (a count or any sized object) inside the block."""
+
+    def __init__(self, profiler, name, rows_in=None):
+        self.profiler = profiler
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self._dump = None
+
+    def __enter__(self):
+        if self.profiler.dump_dir and self.profiler._depth == 0:
+            self._dump = self.profiler._start_dump()
+        self.profiler._depth += 1
+        self._rss = _peak_rss_mb()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        rss = _peak_rss_mb()
+        self.profiler._depth -= 1
+        if self._dump is not None:
+            self.profiler._finish_dump(self._dump, self.name)
+
+        self.profiler.records.append({
+            "stage": self.name,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "peak_rss_delta_mb": None if rss is None else round(rss - self._rss, 2),
+            "rows_in": _rows(self.rows_in),
+            "rows_out": _rows(self.rows_out),
+            "ok": exc_type is None,
+        })
+        return False
+
+
+class Profiler:
+    """
+    Collects wall time, CPU time, peak RSS growth and row counts per stage.
+    When disabled, `stage()` returns a shared no-op context, so instrumented
+    code pays one attribute check per stage.
+    """
+
+    def __init__(self, enabled=True, dump_dir=DUMP_DIR, dump_format=DUMP_FORMAT):
+        self.enabled = enabled
+        self.dump_dir = dump_dir
+        self.dump_format = dump_format
+        self.records = []
+        self._depth = 0
+
+    def stage(self, name, rows_in=None):
+        if not self.enabled:
+            return _NULL_STAGE
+        return Stage(self, name, rows_in)
+
+    def reset(self):
+        self.records = []
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame(self.records)
+
+    def write_jsonl(self, path, **tags):
+        """Append one JSON line per recorded stage, tagged with a run timestamp and `tags`."""
+        run = datetime.now().isoformat(timespec="seconds")
+        with open(path, "a") as f:
+            for record in self.records:
+                f.write(json.dumps({"run": run, **tags, **record}) + "\n")
+
+    # Only the outermost stage is dumped: cProfile cannot nest active profilers
+    def _start_dump(self):
+        if self.dump_format == "pyinstrument":
+            from pyinstrument import Profiler as InstrumentProfiler
+            dump = InstrumentProfiler()
+            dump.start()
+        else:
+            import cProfile
+            dump = cProfile.Profile()
+            dump.enable()
+        return dump
+
+    def _finish_dump(self, dump, name):
+        os.makedirs(self.dump_dir, exist_ok=True)
+        path = os.path.join(self.dump_dir, name.replace(" ", "_"))
+        if self.dump_format == "pyinstrument":
+            dump.stop()
+            with open(f"{path}.html", "w") as f:
+                f.write(dump.output_html())
+        else:
+            dump.disable()
+            dump.dump_stats(f"{path}.prof")
@@ -0,0 +1,220 @@
+import math
+from collections import deque
+
+import numpy as np
+
+# Risk q: probability that a normal score exceeds the anomaly threshold
+DEFAULT_Q = 1e-3
+# The initial threshold t is this quantile of the calibration scores; excesses over it are the "peaks"
+DEFAULT_LEVEL = 0.98
+# Small calibration sets lower the level so the tail still has this many peaks
+MIN_PEAKS = 5
+# Below this many peaks the GPD shape is not estimated (light, exponential tail)
+MIN_SHAPE_PEAKS = 30
+
+
+class SPOT:
+    """
+    Streaming Peaks-Over-Threshold (Siffer et al., KDD 2017).
+
+    `fit` sets an initial threshold t at a high quantile of calibration
+    scores and models the excesses over t ("peaks") with a Generalized
+    Pareto tail; the anomaly threshold is the score exceeded with
+    probability `q`. `update` is O(1): the GPD is fitted by the method of
+    moments from running sums of the peaks, so no history is kept or
+    re-sorted. Scores above the threshold are flagged and left out of the
+    model; normal peaks refine the tail as they arrive.
+    """
+
+    def __init__(self, q=DEFAULT_Q, level=DEFAULT_LEVEL):
+        self.q = q
+        self.level = level
+        self.t = None
+        self.z = None
+        self.n = 0
+        self.n_peaks = 0
+        self.peak_sum = 0.0
+        self.peak_sq_sum = 0.0
+
+    @property
+    def threshold(self):
+        """Current anomaly threshold in score units."""
+        return self.z
+
+    def fit(self, scores):
+        """Calibrate on an initial batch of (mostly normal) scores."""
+        scores = np.asarray(scores, dtype=np.float64)
+        scores = scores[np.isfinite(scores)]
+        if len(scores) == 0:
+            raise ValueError("SPOT needs at least one calibration score")
+
+        level = max(0.5, min(self.level, 1 - MIN_PEAKS / len(scores)))
+        self.t = float(np.quantile(scores, level))
+        excess = scores[scores > self.t] - self.t
+        self.n = len(scores)
+        self.n_peaks = len(excess)
+        self.peak_sum = float(excess.sum())
+        self.peak_sq_sum = float((excess ** 2).sum())
+        self._update_threshold()
+        return self
+
+    def gpd(self):
+        """(shape xi, scale sigma) of the tail, method-of-moments estimates."""
+        mean = self.peak_sum / self.n_peaks
+        var = self.peak_sq_sum / self.n_peaks - mean ** 2
+        if self.n_peaks < MIN_SHAPE_PEAKS or var <= 1e-12 * mean ** 2:
+            # Too few peaks for a shape estimate: exponential tail (xi = 0)
+            return 0.0, mean
+        ratio = mean ** 2 / var
+        return 0.5 * (1 - ratio), 0.5 * mean * (ratio + 1)
+
+    def _update_threshold(self):
+        if self.n_peaks == 0 or self.peak_sum <= 0:
+            self.z = self.t
+            return
+        xi, sigma = self.gpd()
+        r = self.q * self.n / self.n_peaks
+        if abs(xi) < 1e-8:
+            z = self.t - sigma * math.log(r)
+        else:
+            z = self.t + sigma / xi * (r ** -xi - 1)
+        # q * n above the number of peaks would put z below the initial threshold
+        self.z = max(z, self.t)
+
+    def _add(self, x):
+        self.n += 1
+        if x > self.t:
+            excess = x - self.t
+            self.n_peaks += 1
+            self.peak_sum += excess
+            self.peak_sq_sum += excess * excess
+            self._update_threshold()
+
+    def update(self, x):
+        """Add one score; returns True if it is anomalous (then it is not learned)."""
+        if x > self.threshold:
+            return True
+        self._add(x)
+        return False
+
+    def run(self, scores):
+        """Stream a batch through `update`: (anomaly flags, threshold in effect for each score)."""
+        scores = np.asarray(scores, dtype=np.float64)
+        flags = np.zeros(len(scores), dtype=bool)
+        thresholds = np.empty(len(scores))
+        for i, x in enumerate(scores.tolist()):
+            thresholds[i] = self.threshold
+            flags[i] = self.update(x)
+        return flags, thresholds
+
+    def calibration_flags(self, scores):
+        """Flags for the scores `fit` was called with, judged against the calibrated threshold."""
+        return np.asarray(scores, dtype=np.float64) > self.threshold
+
+    def state(self):
+        """Plain-dict snapshot (floats, ints and lists) for model artifacts."""
+        return {
+            "depth": None, "q": self.q, "level": self.level, "t": self.t, "n": self.n,
+            "n_peaks": self.n_peaks, "peak_sum": self.peak_sum, "peak_sq_sum": self.peak_sq_sum,
+        }
+
+    def _load(self, state):
+        for name in ("t", "n", "n_peaks", "peak_sum", "peak_sq_sum"):
+            setattr(self, name, state[name])
+        self._update_threshold()
+        return self
+
+
+class DSPOT(SPOT):
+    """
+    Drift-aware SPOT: thresholds the residual of each score against the mean
+    of the last `depth` normal scores, so a slowly moving baseline does not
+    turn into a run of anomalies. The drift mean is a running sum (O(1)).
+    """
+
+    def __init__(self, depth=10, q=DEFAULT_Q, level=DEFAULT_LEVEL):
+        super().__init__(q, level)
+        self.depth = depth
+        self.window = deque(maxlen=depth)
+        self.window_sum = 0.0
+
+    @property
+    def drift(self):
+        return self.window_sum / len(self.window) if self.window else 0.0
+
+    @property
+    def threshold(self):
+        return self.z + self.drift
+
+    def fit(self, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        scores = scores[np.isfinite(scores)]
+        if len(scores) < self.depth + 2:
+            raise ValueError(f"DSPOT(depth={self.depth}) needs at least {self.depth + 2} calibration scores")
+        super().fit(self._residuals(scores))
+        self.window.clear()
+        self.window.extend(scores[-self.depth:].tolist())
+        self.window_sum = float(sum(self.window))
+        return self
+
+    def _residuals(self, scores):
+        """Residual of each score against the mean of the `depth` scores before it."""
+        csum = np.concatenate(([0.0], np.cumsum(scores)))
+        local_mean = (csum[self.depth:-1] - csum[:-self.depth - 1]) / self.depth
+        return scores[self.depth:] - local_mean
+
+    def calibration_flags(self, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        flags = np.zeros(len(scores), dtype=bool)
+        # The first `depth` scores only seed the baseline
+        flags[self.depth:] = self._residuals(scores) > self.z
+        return flags
+
+    def update(self, x):
+        if x > self.threshold:
+            return True
+        self._add(x - self.drift)
+        if len(self.window) == self.depth:
+            self.window_sum -= self.window[0]
+        self.window.append(x)
+        self.window_sum += x
+        return False
+
+    def state(self):
+        return {**super().state(), "depth": self.depth, "window": list(self.window)}
+
+    def _load(self, state):
+        self.window.extend(state["window"])
+        self.window_sum = float(sum(self.window))
+        return super()._load(state)
+
+
+def calibration_size(n, fraction, depth=None):
+    """
+    Number of leading scores (of `n`) to calibrate on: `fraction` of them,
+    but at least what DSPOT(depth) needs (2 for SPOT) and at most `n`.
+    """
+    return min(n, max(int(fraction * n), (depth or 0) + 2))
+
+
+def run_calibrated(spot, scores, n):
+    """
+    Anomaly flags for a series whose first `n` scores calibrated `spot`:
+    those are judged against the calibrated threshold and only the rest is
+    streamed through `update`, so no score enters the tail model twice.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    flags = np.empty(len(scores), dtype=bool)
+    flags[:n] = spot.calibration_flags(scores[:n])
+    flags[n:], _ = spot.run(scores[n:])
+    return flags
+
+
+def make_spot(q=DEFAULT_Q, level=DEFAULT_LEVEL, depth=None):
+    """SPOT, or DSPOT when a drift `depth` is given."""
+    return DSPOT(depth, q, level) if depth else SPOT(q, level)
+
+
+def spot_from_state(state):
+    """Rebuild a calibrated SPOT/DSPOT from `state()` output."""
+    return make_spot(state["q"], state["level"], state["depth"])._load(state)
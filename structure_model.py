@@ -1,40 +1,99 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
-def detect_structure_anomalies(df, window_size=5):
-    signal_cols = [c for c in df.columns if "_mean" in c]
-    
-    # Calculate rolling correlations (requires at least window_size points)
-    # This detects when the RELATIONSHIP between signals breaks suddenly
-    scores = []
-    
-    for i in range(len(df)):
-        if i < window_size:
-            scores.append(0.0)
-            continue
-            
-        # Current local baseline (last 'window_size' steps)
-        history = df.iloc[i-window_size:i][signal_cols]
-        baseline_corr = history.corr().fillna(0).values
-        
-        # Current observation relationship
-        # outer product captures the instantaneous relationship
-        current_vals = df.iloc[i][signal_cols].values
-        current_rel = np.outer(current_vals, current_vals)
-        
-        # Normalize current_rel to be comparable to correlation if needed, 
-        # but here we just look for sudden departures from the local trend.
-        # A simpler way is to compare current correlation with rolling correlation
-        
-        # Improved: Compare current correlation matrix (last 2 samples) with local history
-        current_window = df.iloc[max(0, i-1):i+1][signal_cols]
-        current_corr = current_window.corr().fillna(0).values
-        
-        drift = np.abs(current_corr - baseline_corr).mean()
-        scores.append(drift)
+from feature_matrix import FeatureMatrix
+from spot import DEFAULT_LEVEL, DEFAULT_Q, calibration_size, make_spot, run_calibrated
+
+# Upper bound on rows x k x k elements held at once while scoring.
+BLOCK_ELEMENTS = 1 << 22
+# Leading fraction of the scores (after warm-up) the POT threshold is calibrated on
+CALIBRATION = 0.2
+
+
+def _window_correlations(X, window_size, start, stop):
+    """
+    Correlation matrices of X[i-window_size:i] for every i in [start, stop),
+    computed for all rows at once with one batched matrix product instead of
+    one .corr() call per row.
+    """
+    windows = sliding_window_view(X[start - window_size:stop - 1], window_size, axis=0)
+    centered = windows - windows.mean(axis=2, keepdims=True)
+    var = np.einsum("nkw,nkw->nk", centered, centered)
+
+    # A column that is constant inside the window has no correlation (pandas
+    # gives NaN, filled with 0). Centering a constant leaves residue of order
+    # eps * |value|, so anything below that squared is treated as flat.
+    level = np.einsum("nkw,nkw->nk", windows, windows)
+    valid = var > (16 * np.finfo(X.dtype).eps) ** 2 * level
+
+    # Scaling each column to unit norm first makes the product the correlation
+    # itself; an infinite norm sends that row and column to exactly 0.
+    norm = np.where(valid, np.sqrt(var), np.inf)
+    centered /= norm[:, :, None]
+    return np.matmul(centered, centered.transpose(0, 2, 1))
+
+
+def structure_scores(X, window_size=5, dtype=np.float64):
+    """
+    Relationship-drift score per row of an (n, k) signal matrix.
+
+    For row i the score is the mean absolute difference between the
+    correlation of the last two rows (i-1, i) and the correlation of the
+    preceding `window_size` rows. A two-row correlation is just the outer
+    product of the step signs, so only the baseline needs real work.
+    Pass dtype=np.float32 to halve memory and bandwidth.
+    """
+    X = np.asarray(X, dtype=dtype)
+    n, k = X.shape
+    scores = np.zeros(n, dtype=dtype)
+    if n <= window_size or k == 0:
+        return scores
+
+    step_sign = np.sign(np.diff(X, axis=0))
+
+    block = max(1, BLOCK_ELEMENTS // (k * k))
+    for start in range(window_size, n, block):
+        stop = min(n, start + block)
+        baseline = _window_correlations(X, window_size, start, stop)
+        sgn = step_sign[start - 1:stop - 1]
+        baseline -= sgn[:, :, None] * sgn[:, None, :]
+        scores[start:stop] = np.abs(baseline).mean(axis=(1, 2))
+
+    return scores
+
+
+def fit_structure_spot(scores, window_size=5, calibration=CALIBRATION, q=DEFAULT_Q, level=DEFAULT_LEVEL, depth=None):
+    """
+    SPOT/DSPOT calibrated on the first `calibration` fraction of `scores`
+    (after the `window_size` warm-up rows, which are always 0). Returns
+    (spot, number of scores after the warm-up it was calibrated on).
+    """
+    scores = np.asarray(scores)[window_size:]
+    n = calibration_size(len(scores), calibration, depth)
+    return make_spot(q, level, depth).fit(scores[:n]), n
+
+
+def detect_structure_anomalies(df, window_size=5, dtype=np.float32, calibration=CALIBRATION, q=DEFAULT_Q, depth=None):
+    """
+    Score relationship drift and flag it with a streaming POT threshold:
+    calibrated on the first `calibration` fraction of the run (whose windows
+    are judged against that threshold), then updated window by window (see
+    spot.SPOT; `depth` enables drift-aware DSPOT).
+    `df` is a window frame or a FeatureMatrix (then a frame over its block
+    is returned); the window means are read in place.
+    """
+    if isinstance(df, FeatureMatrix):
+        df = df.to_frame()
+    means = FeatureMatrix.from_frame(df).stat("mean")
+
+    # Rolling correlations detect when the RELATIONSHIP between signals breaks suddenly
+    scores = structure_scores(means, window_size, dtype)
 
     df["structure_score"] = scores
-    # Dynamic threshold based on the scores in this run
-    threshold = np.percentile(scores, 95)
-    df["structure_anomaly"] = df["structure_score"] > threshold
+    anomaly = np.zeros(len(scores), dtype=bool)
+    if len(scores) >= window_size + (depth or 0) + 2:
+        spot, n = fit_structure_spot(scores, window_size, calibration, q, depth=depth)
+        anomaly[window_size:] = run_calibrated(spot, scores[window_size:], n)
+    df["structure_anomaly"] = anomaly
 
-    return df
\ No newline at end of file
+    return df
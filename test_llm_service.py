@@ -0,0 +1,160 @@
+"""Offline checks for llm_service: everything runs against the "stub" provider."""
+import asyncio
+import time
+
+import pytest
+
+import llm_service
+from llm_service import DiagnosisCache, build_batch_prompt, build_prompt, diagnose_events, split_batch_response
+
+
+def _context(score, logs=()):
+    return {
+        "severity": "CRITICAL", "behavior_score": score, "duration": 10,
+        "logs": list(logs), "root_causes": [("motor_temp", 0.62), ("vibration", 0.21)],
+    }
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A fresh on-disk cache installed as the module's shared cache."""
+    cache = DiagnosisCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(llm_service, "_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Manually advanced wall clock for TTL / LRU timestamps."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(llm_service.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def stub_calls(monkeypatch):
+    """Records every prompt that reaches the stub provider (i.e. every cache miss)."""
+    calls = []
+    complete = llm_service._stub_completion
+
+    def counting(prompt):
+        calls.append(prompt)
+        return complete(prompt)
+
+    monkeypatch.setattr(llm_service, "_stub_completion", counting)
+    return calls
+
+
+def test_stub_answers_every_prompt_field():
+    answer = llm_service._stub_completion(build_prompt(_context(1.25)))
+    assert "score 1.25" in answer and "10 min" in answer
+
+
+def test_cache_miss_then_hit(cache, stub_calls):
+    context = _context(1.5)
+    first = llm_service.get_ai_diagnosis(None, context, provider="stub")
+    second = llm_service.get_ai_diagnosis(None, context, provider="stub")
+    assert first == second
+    assert len(stub_calls) == 1
+
+    llm_service.get_ai_diagnosis(None, _context(2.5), provider="stub")
+    assert len(stub_calls) == 2
+
+
+def test_cache_disabled_always_calls_provider(cache, stub_calls):
+    for _ in range(2):
+        llm_service.get_ai_diagnosis(None, _context(1.5), provider="stub", use_cache=False)
+    assert len(stub_calls) == 2
+
+
+def test_errors_are_not_cached(cache):
+    key = DiagnosisCache.key("nope", None, build_prompt(_context(1.0)))
+    text = llm_service.get_ai_diagnosis(None, _context(1.0), provider="nope")
+    assert "Unknown Provider" in text
+    assert cache.get(key) is None
+
+
+def test_cache_entries_expire_after_ttl(tmp_path, clock):
+    cache = DiagnosisCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    cache.put("k", "answer")
+    clock[0] += 59
+    assert cache.get("k") == "answer"
+    clock[0] += 2
+    assert cache.get("k") is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path, clock):
+    cache = DiagnosisCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.put("a", "A")
+    clock[0] += 1
+    cache.put("b", "B")
+    clock[0] += 1
+    assert cache.get("a") == "A"  # "a" is now more recently used than "b"
+    clock[0] += 1
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+
+
+def test_batch_prompt_round_trips_through_split():
+    contexts = [_context(1.0 + i) for i in range(3)]
+    prompt = build_batch_prompt(contexts)
+    assert [f"### Event {i}" in prompt for i in (1, 2, 3)] == [True] * 3
+
+    answers = split_batch_response(llm_service._stub_completion(prompt), len(contexts))
+    assert [f"score {1.0 + i}" in a for i, a in enumerate(answers)] == [True] * 3
+
+
+def test_split_falls_back_to_full_text_when_headers_are_missing():
+    assert split_batch_response("one answer for all", 2) == ["one answer for all"] * 2
+    assert split_batch_response("### Event 1\nonly the first", 2) == ["### Event 1\nonly the first"] * 2
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 3])
+def test_diagnose_events_keeps_context_order(cache, monkeypatch, batch_size):
+    complete = llm_service._stub_completion
+
+    def slow_first(prompt):
+        # Earlier prompts answer later, so completion order is the reverse of input order
+        if "score 0.0" in complete(prompt):
+            time.sleep(0.2)
+        return complete(prompt)
+
+    monkeypatch.setattr(llm_service, "_stub_completion", slow_first)
+    contexts = [_context(float(i)) for i in range(7)]
+    answers = asyncio.run(diagnose_events(
+        None, contexts, provider="stub", max_concurrency=3, batch_size=batch_size, use_cache=False,
+    ))
+    assert len(answers) == len(contexts)
+    for i, answer in enumerate(answers):
+        assert f"score {float(i)}," in answer
+
+
+def test_diagnose_events_fails_over_to_next_route(cache):
+    answers = asyncio.run(diagnose_events(
+        None, [_context(1.0)], provider="nope", fallbacks=[("stub", None)], use_cache=False,
+    ))
+    assert "score 1.0" in answers[0]
+
+
+def test_diagnose_events_falls_back_to_rules_when_no_route_answers(cache):
+    answers = asyncio.run(diagnose_events(None, [_context(1.0)], provider="nope", use_cache=False))
+    assert "rule-based assessment" in answers[0]
+    assert "motor_temp (62%)" in answers[0]
+
+
+def test_diagnose_events_budget_bounds_the_whole_panel(cache, monkeypatch):
+    def slow(prompt):
+        time.sleep(0.4)
+        return "slow answer"
+
+    monkeypatch.setattr(llm_service, "_stub_completion", slow)
+    started = time.perf_counter()
+    answers = asyncio.run(diagnose_events(
+        None, [_context(float(i)) for i in range(8)], provider="stub",
+        max_concurrency=2, use_cache=False, budget=0.6,
+    ))
+    # Four rounds of 0.4s if the budget only started once a prompt got a slot
+    assert time.perf_counter() - started < 1.0
+    assert answers[:2] == ["slow answer"] * 2
+    assert all("rule-based assessment" in a for a in answers[2:])
@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+# Columnar cache for uploaded time-series. Entries are Arrow IPC files named by
+# the SHA-256 of the raw upload, so each distinct CSV is parsed exactly once
+# and every later rerun memory-maps the cached columns instead.
+CACHE_DIR = os.environ.get("TS_CACHE_DIR", ".ts_cache")
+MAX_CACHE_BYTES = int(os.environ.get("TS_CACHE_MAX_BYTES", 2 * 2**30))
+
+CSV_SCHEMA = {
+    "signal_id": pa.dictionary(pa.int32(), pa.string()),
+    "timestamp": pa.timestamp("ns"),
+    "value": pa.float64(),
+}
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _entry_path(key, cache_dir):
+    return os.path.join(cache_dir, f"{key}.arrow")
+
+
+def _read_csv(data):
+    try:
+        return pacsv.read_csv(
+            pa.BufferReader(data),
+            convert_options=pacsv.ConvertOptions(column_types=CSV_SCHEMA),
+        )
+    except pa.ArrowInvalid:
+        # Arrow only parses ISO 8601; other timestamp layouts go through pandas' inference
+        import pandas as pd
+        table = pacsv.read_csv(
+            pa.BufferReader(data),
+            convert_options=pacsv.ConvertOptions(column_types={**CSV_SCHEMA, "timestamp": pa.string()}),
+        )
+        timestamps = pd.to_datetime(table.column("timestamp").to_pandas()).astype("datetime64[ns]")
+        i = table.schema.get_field_index("timestamp")
+        return table.set_column(i, "timestamp", pa.array(timestamps, type=CSV_SCHEMA["timestamp"]))
+
+
+def _write_entry(data, path):
+    table = _read_csv(data)
+    # Write to a temp name first so concurrent readers never see a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, keep=()):
+    """
+    Drop least-recently-used entries until the cache fits in `max_bytes`.
+    Paths in `keep` are never removed, even if they alone exceed the limit.
+    """
+    keep = {os.path.basename(path) for path in keep}
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".arrow"):
+            try:
+                st = os.stat(os.path.join(cache_dir, name))
+            except FileNotFoundError:  # evicted by another process meanwhile
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def cache_timeseries(data, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """
+    Return the cache file for a raw time-series CSV upload (bytes), parsing
+    it into Arrow IPC only if this exact content has not been seen before.
+    """
+    data = bytes(data)
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _entry_path(content_hash(data), cache_dir)
+
+    if os.path.exists(path):
+        # Hits refresh the mtime, which is what LRU eviction orders by
+        os.utime(path)
+    else:
+        _write_entry(data, path)
+        # The entry being returned stays, even if it alone is over the limit
+        evict(cache_dir, max_bytes, keep=(path,))
+    return path
+
+
+def load_cached(path):
+    """Memory-map a cache entry; numeric columns are handed to pandas without copying."""
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)